@@ -0,0 +1,248 @@
+# Measure the overhead of the subtests machinery, in microseconds per subtest and bytes per report.
+#
+# Each case generates a test module running a loop of subtests and runs it with pytest in a
+# subprocess; the time spent in the loop is measured inside the test itself, so pytest's startup
+# and collection are not included. The memory per report is measured in a separate run, tracing
+# the memory still allocated once the loop is over (mostly the reports kept by the terminal
+# reporter) with tracemalloc.
+#
+# Usage:
+#
+#     python benchmarks/bench_subtests.py [--subtests N] [--repeat R] [--json PATH] [--compare PATH] [CASE ...]
+#
+# Run it from two checkouts (or with ``PYTHONPATH`` pointing to their ``src`` directories), saving
+# the results of the first one with ``--json`` and comparing the second one to them with
+# ``--compare``, to measure the overhead before and after a change.
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import NamedTuple
+
+
+class Case(NamedTuple):
+    body: str
+    args: tuple[str, ...] = ()
+    template: str = "fixture"
+    conftest: str = ""
+    kwargs: int = 0
+
+
+# Serializes and parses back every report, as pytest-xdist does between workers and controller,
+# without the cost of the transport.
+SERIALIZE_CONFTEST = """
+CONFIG = None
+
+
+def pytest_configure(config):
+    global CONFIG
+    CONFIG = config
+
+
+def pytest_runtest_logreport(report):
+    data = CONFIG.hook.pytest_report_to_serializable(config=CONFIG, report=report)
+    CONFIG.hook.pytest_report_from_serializable(config=CONFIG, data=data)
+"""
+
+# Some work in the body of the subtests, as the body of a skipped subtests.test() block still runs
+# unless it checks whether the subtest is skipped.
+WORK = "sum(range(20000))"
+
+CASES = {
+    "empty": Case("pass"),
+    "capture-sys": Case("pass", ("--capture=sys",)),
+    "capture-no": Case("pass", ("--capture=no",)),
+    "subtests-capture-no": Case("pass", ("--subtests-capture=no",)),
+    "failing": Case("assert i < 0"),
+    "logging-quiet": Case("pass", ("--log-level=INFO",)),
+    "logging": Case("logging.info('subtest %s', i)", ("--log-level=INFO",)),
+    "no-logging-plugin": Case("pass", ("-p", "no:logging")),
+    "no-subtests-reports": Case("pass", ("--no-subtests-reports",)),
+    "aggregate": Case("pass", ("--subtests-aggregate",)),
+    "retain-failed": Case("pass", ("--subtests-retain=failed",)),
+    "work": Case(WORK),
+    # Only the first subtest fails, the others are skipped after it.
+    "skipped-maxfail": Case(f"assert i > 0; {WORK}", ("--subtests-maxfail=1",)),
+    "skipped-maxfail-checked": Case(
+        f"if not subtest.skipped: assert i > 0; {WORK}", ("--subtests-maxfail=1",)
+    ),
+    "skipped-shard": Case(WORK, ("--subtests-shard=1/2",)),
+    "skipped-shard-checked": Case(
+        f"if not subtest.skipped: {WORK}", ("--subtests-shard=1/2",)
+    ),
+    "xdist-serialization": Case("pass", conftest=SERIALIZE_CONFTEST),
+    "many-kwargs": Case("pass", kwargs=20),
+    "many-kwargs-verbose": Case("pass", ("-v",), kwargs=20),
+    "many-kwargs-serialization": Case("pass", conftest=SERIALIZE_CONFTEST, kwargs=20),
+    "unittest": Case("pass", template="unittest"),
+    "unittest-failing": Case("self.assertLess(i, 0)", template="unittest"),
+    "unittest-capture-no": Case(
+        "pass", ("--subtests-capture=no",), template="unittest"
+    ),
+}
+
+TEMPLATES = {
+    "fixture": """
+import json
+import logging
+import os
+import time
+import tracemalloc
+
+KWARGS = {{f"param{{k}}": "value" for k in range({kwargs})}}
+
+
+def test_bench(subtests):
+    if os.environ.get("SUBTESTS_BENCH_MEMORY"):
+        tracemalloc.start()
+    start = time.perf_counter()
+    for i in range({subtests}):
+        with subtests.test(i=i, **KWARGS) as subtest:
+            {body}
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    with open(os.environ["SUBTESTS_BENCH_OUTPUT"], "w") as f:
+        json.dump([elapsed, memory], f)
+""",
+    "unittest": """
+import json
+import logging
+import os
+import time
+import tracemalloc
+import unittest
+
+KWARGS = {{f"param{{k}}": "value" for k in range({kwargs})}}
+
+
+class TestBench(unittest.TestCase):
+    def test_bench(self):
+        if os.environ.get("SUBTESTS_BENCH_MEMORY"):
+            tracemalloc.start()
+        start = time.perf_counter()
+        for i in range({subtests}):
+            with self.subTest(i=i, **KWARGS):
+                {body}
+        elapsed = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        with open(os.environ["SUBTESTS_BENCH_OUTPUT"], "w") as f:
+            json.dump([elapsed, memory], f)
+""",
+}
+
+
+class Result(NamedTuple):
+    us_per_subtest: float
+    bytes_per_report: float
+
+
+def run_case(
+    case: Case, subtests: int, tmp_path: Path, memory: bool = False
+) -> tuple[float, int]:
+    """
+    Run one case and return the time spent in the subtests loop, in seconds, and the memory
+    still allocated after it, in bytes (only traced if ``memory`` is true, else 0).
+    """
+    test_file = tmp_path / "test_bench.py"
+    test_file.write_text(
+        TEMPLATES[case.template].format(
+            subtests=subtests, body=case.body, kwargs=case.kwargs
+        ),
+        encoding="utf-8",
+    )
+    (tmp_path / "conftest.py").write_text(case.conftest, encoding="utf-8")
+    output = tmp_path / "result.txt"
+    env = dict(os.environ, SUBTESTS_BENCH_OUTPUT=str(output))
+    if memory:
+        env["SUBTESTS_BENCH_MEMORY"] = "1"
+    output.unlink(missing_ok=True)
+    subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider"]
+        + list(case.args)
+        + [str(test_file)],
+        cwd=tmp_path,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        check=False,
+    )
+    elapsed, allocated = json.loads(output.read_text(encoding="utf-8"))
+    return elapsed, allocated
+
+
+def measure(case: Case, subtests: int, repeat: int, tmp_path: Path) -> Result:
+    elapsed = min(run_case(case, subtests, tmp_path)[0] for _ in range(repeat))
+    _, allocated = run_case(case, subtests, tmp_path, memory=True)
+    return Result(elapsed / subtests * 1e6, allocated / subtests)
+
+
+def format_change(value: float, baseline: float | None) -> str:
+    if not baseline:
+        return ""
+    return f"{(value - baseline) / baseline:+.0%}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Measure the overhead of the subtests machinery."
+    )
+    parser.add_argument(
+        "cases", nargs="*", metavar="CASE", help=f"one of {', '.join(CASES)}"
+    )
+    parser.add_argument("--subtests", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--json", type=Path, metavar="PATH", help="save the results to PATH"
+    )
+    parser.add_argument(
+        "--compare",
+        type=Path,
+        metavar="PATH",
+        help="compare to the results saved to PATH with --json",
+    )
+    options = parser.parse_args()
+    for name in options.cases:
+        if name not in CASES:
+            parser.error(f"unknown case: {name}")
+    baseline = {}
+    if options.compare is not None:
+        baseline = json.loads(options.compare.read_text(encoding="utf-8"))["cases"]
+
+    results = {}
+    header = f"{'case':<24}{'us/subtest':>12}{'bytes/report':>14}"
+    if baseline:
+        header += f"{'us change':>11}{'bytes change':>14}"
+    print(header)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in options.cases or CASES:
+            result = measure(CASES[name], options.subtests, options.repeat, Path(tmp))
+            results[name] = result._asdict()
+            line = f"{name:<24}{result.us_per_subtest:>12.1f}{result.bytes_per_report:>14.0f}"
+            if baseline:
+                base = baseline.get(name, {})
+                line += f"{format_change(result.us_per_subtest, base.get('us_per_subtest')):>11}"
+                line += f"{format_change(result.bytes_per_report, base.get('bytes_per_report')):>14}"
+            print(line)
+
+    if options.json is not None:
+        options.json.write_text(
+            json.dumps(
+                {
+                    "python": platform.python_version(),
+                    "subtests": options.subtests,
+                    "cases": results,
+                },
+                indent=2,
+            )
+            + "\n",
+            encoding="utf-8",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,96 @@
 from __future__ import annotations
 
+import argparse
+import ast
+import heapq
+import importlib.util
+import io
+import itertools
+import logging
+import math
+import os
+import platform
+import queue
+import re
+import shutil
+import signal
 import sys
+import threading
 import time
+import traceback
+import tracemalloc
+import weakref
+import zlib
+from concurrent.futures import Future
+from concurrent.futures import wait as wait_futures
 from contextlib import contextmanager
 from contextlib import ExitStack
 from contextlib import nullcontext
+from datetime import datetime
+from functools import partial
+from pathlib import Path
 from typing import Any
+from typing import Awaitable
 from typing import Callable
+from typing import ClassVar
+from typing import Collection
 from typing import ContextManager
 from typing import Generator
+from typing import IO
+from typing import Iterable
 from typing import Iterator
 from typing import Mapping
+from typing import NoReturn
 from typing import TYPE_CHECKING
 from unittest import TestCase
+from xml.etree import ElementTree
 
 import attr
 import pluggy
 import pytest
 from _pytest._code import ExceptionInfo
+from _pytest._io.saferepr import saferepr
+from _pytest.assertion.rewrite import AssertionRewritingHook
+from _pytest.assertion.rewrite import rewrite_asserts
 from _pytest.capture import CaptureFixture
 from _pytest.capture import FDCapture
+from _pytest.capture import MultiCapture
 from _pytest.capture import SysCapture
 from _pytest.fixtures import SubRequest
+from _pytest.junitxml import bin_xml_escape
+from _pytest.junitxml import mangle_test_address
 from _pytest.logging import catching_logs
+from _pytest.logging import get_option_ini
 from _pytest.logging import LogCaptureHandler
+from _pytest.outcomes import Exit
 from _pytest.outcomes import OutcomeException
 from _pytest.reports import TestReport
 from _pytest.runner import CallInfo
 from _pytest.runner import check_interactive_exception
 from _pytest.unittest import TestCaseFunction
 
-
 if TYPE_CHECKING:
+    import asyncio
+    import cProfile
+    import pstats
+    from types import FrameType
     from types import TracebackType
 
     from typing import Literal
 
+    from _pytest._io import TerminalWriter
+    from _pytest.terminal import TerminalReporter
+
+
+# Level used to disable the shared log handler between subtests.
+_DISABLED_LOG_LEVEL = sys.maxsize
+
+# Maximum size of the parameters of the subtests of subtests.iterate() which are not numbers.
+_COMPACT_ID_SIZE = 40
+
+# Default item of subtests, which are not created by subtests.iterate().
+_NO_ITEM = object()
+
 
 def pytest_addoption(parser: pytest.Parser) -> None:
     group = parser.getgroup("subtests")
@@ -53,12 +108,284 @@ def pytest_addoption(parser: pytest.Parser) -> None:
         default=False,
         help="Disables subtest output unless it's a failed subtest (EXPERIMENTAL)",
     )
+    group.addoption(
+        "--subtests-progress",
+        action="store",
+        dest="subtests_progress",
+        choices=("letters", "counter"),
+        default="letters",
+        help="How the progress of subtests is shown in non-verbose mode: 'letters' writes a letter for "
+        "each subtest, 'counter' shows a counter of the subtests of the running test instead, updated in "
+        "place on terminals supporting it. Default: letters (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-capture",
+        action="store",
+        dest="subtests_capture",
+        choices=("inherit", "no", "sys", "fd"),
+        default="inherit",
+        help="Capture method for the output of subtests: 'inherit' (default) uses the --capture "
+        "method, 'sys' and 'fd' override it, and 'no' captures neither the output nor the log "
+        "records of subtests, which go to the test's own capture (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-shared-capture",
+        action="store_true",
+        dest="subtests_shared_capture",
+        default=False,
+        help="Starts the output capture once per test and shares it between its subtests, "
+        "instead of starting a new capture for each subtest (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-aggregate",
+        action="store_true",
+        dest="subtests_aggregate",
+        default=False,
+        help="Only counts passing subtests and reports them as a single summary per test, "
+        "failed subtests are still reported individually (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-shard",
+        action="store",
+        dest="subtests_shard",
+        type=parse_shard,
+        default=None,
+        metavar="INDEX/COUNT|auto",
+        help="Only runs the subtests of shard INDEX (0 based) out of COUNT, assigning the subtests of each "
+        "test to the shards in turn, in the order they are created; 'auto' uses the pytest-xdist worker "
+        "index and count, to be used with '--dist each' (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-xdist-batch",
+        action="store",
+        dest="subtests_xdist_batch",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Sends the reports of passing and skipped subtests from pytest-xdist workers in batches of N, "
+        "each report only containing what differs from the last one of the batch (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-durations",
+        action="store",
+        dest="subtests_durations",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Shows the N slowest subtests (N=0 for all) (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-durations-min",
+        action="store",
+        dest="subtests_durations_min",
+        type=float,
+        default=0.005,
+        metavar="SECONDS",
+        help="Minimal duration in seconds for inclusion in the slowest subtests list shown by "
+        "--subtests-durations. Default: 0.005 (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-profile",
+        action="store_true",
+        dest="subtests_profile",
+        default=False,
+        help="Profiles the subtests with cProfile, writing the merged profile of the subtests of each test "
+        "to --subtests-profile-dir; the top functions of the subtests taking at least "
+        "--subtests-durations-min are added to their report (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-profile-dir",
+        action="store",
+        dest="subtests_profile_dir",
+        default="prof",
+        metavar="DIR",
+        help="Directory where --subtests-profile writes the profiles. Default: prof (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-profile-filter",
+        action="store",
+        dest="subtests_profile_filter",
+        type=re.compile,
+        default=None,
+        metavar="REGEX",
+        help="Only profiles the subtests whose description (message and parameters) "
+        "matches REGEX (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-memory",
+        action="store_true",
+        dest="subtests_memory",
+        default=False,
+        help="Traces the memory allocated by subtests with tracemalloc and the change of the resident set "
+        "size, adding them to their report, and shows the subtests with the highest peak (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-memory-top",
+        action="store",
+        dest="subtests_memory_top",
+        type=int,
+        default=10,
+        metavar="N",
+        help="Number of subtests shown by --subtests-memory (N=0 for all). Default: 10 (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-maxfail",
+        action="store",
+        dest="subtests_maxfail",
+        type=parse_maxfail,
+        default=None,
+        metavar="N",
+        help="Skips the remaining subtests of a test after N of its subtests failed, reporting how "
+        "many were skipped in a single report (N=0 for no limit) (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-timeout",
+        action="store",
+        dest="subtests_timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Fails the subtests running for more than SECONDS, reporting where they were stuck, "
+        "and goes on with the next subtest (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-junitxml",
+        action="store",
+        dest="subtests_junitxml",
+        default=None,
+        metavar="PATH",
+        help="Writes a JUnit XML report of the subtests to PATH, with a testcase for each subtest, "
+        "streamed to PATH.part as they are reported (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-retain",
+        action="store",
+        dest="subtests_retain",
+        choices=("all", "failed"),
+        default="all",
+        help="Which subtest reports are kept whole until the end of the session: with 'failed', the "
+        "reports of passed and skipped subtests are reduced to what the terminal summary needs once "
+        "reported, releasing their parameters and captured output. Default: all (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-lf",
+        "--subtests-last-failed",
+        action="store_true",
+        dest="subtests_lf",
+        default=False,
+        help="Only runs the subtests which failed in the last run, in the tests which had failing "
+        "subtests (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-ff",
+        "--subtests-failed-first",
+        action="store_true",
+        dest="subtests_ff",
+        default=False,
+        help="Runs the subtests which failed in the last run first, for the subtests run by "
+        "subtests.map() and subtests.gather() (EXPERIMENTAL)",
+    )
+    group.addoption(
+        "--subtests-memory-budget",
+        action="store",
+        dest="subtests_memory_budget",
+        type=parse_size,
+        default=None,
+        metavar="SIZE",
+        help="Fails the subtests whose peak of traced memory is above SIZE, in bytes or with a "
+        "K, M or G suffix; implies --subtests-memory (EXPERIMENTAL)",
+    )
 
 
-@attr.s
+def parse_shard(value: str) -> tuple[int, int] | Literal["auto"]:
+    """Parse the value of ``--subtests-shard``."""
+    if value == "auto":
+        return "auto"
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"expected INDEX/COUNT or 'auto', got {value!r}"
+        ) from None
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(
+            f"shard index must be between 0 and {count - 1}, got {value!r}"
+        )
+    return index, count
+
+
+def parse_maxfail(value: str) -> int:
+    """Parse the value of ``--subtests-maxfail``, where 0 means no limit as with ``--maxfail``."""
+    if re.fullmatch(r"\d+", value.strip()) is None:
+        raise argparse.ArgumentTypeError(
+            f"expected a number of failures, or 0 for no limit, got {value!r}"
+        )
+    return int(value)
+
+
+def parse_size(value: str) -> int:
+    """Parse the value of ``--subtests-memory-budget``."""
+    match = re.fullmatch(r"(\d+)([KMG]?)", value.strip().upper())
+    if match is None:
+        raise argparse.ArgumentTypeError(
+            f"expected a size like 512K, 100M or 1G, got {value!r}"
+        )
+    number, unit = match.groups()
+    return int(number) * 1024 ** "_KMG".index(unit or "_")
+
+
+def format_size(size: int, sign: bool = False) -> str:
+    return f"{size / 2**20:{'+' if sign else ''}.1f} MiB"
+
+
+def memory_tracing_enabled(config: pytest.Config) -> bool:
+    return (
+        config.getoption("subtests_memory", False)
+        or config.getoption("subtests_memory_budget", None) is not None
+    )
+
+
+def get_shard(config: pytest.Config) -> tuple[int, int] | None:
+    """
+    Return the shard whose subtests are run by this process as ``(index, count)``, or ``None``
+    to run all subtests.
+    """
+    shard = config.getoption("subtests_shard", None)
+    if shard == "auto":
+        workerinput = getattr(config, "workerinput", None)
+        if workerinput is None:
+            return None
+        return int(workerinput["workerid"][2:]), workerinput["workercount"]
+    return shard
+
+
+# Not hashable, as its kwargs are not.
+@attr.s(frozen=True, slots=True, hash=False)
 class SubTestContext:
     msg: str | None = attr.ib()
     kwargs: dict[str, Any] = attr.ib()
+    # Computed on first use, as it is needed several times per report.
+    _description: str | None = attr.ib(default=None, init=False, eq=False, repr=False)
+
+    def description(self) -> str:
+        description = self._description
+        if description is None:
+            parts = []
+            if isinstance(self.msg, str):
+                parts.append(f"[{self.msg}]")
+            if self.kwargs:
+                params_desc = ", ".join(
+                    f"{k}={v!r}" for (k, v) in sorted(self.kwargs.items())
+                )
+                parts.append(f"({params_desc})")
+            description = " ".join(parts) or "(<subtest>)"
+            object.__setattr__(self, "_description", description)
+        return description
+
+    def _to_json(self) -> dict[str, Any]:
+        # Without the description, which the receiver computes again when needed, as sending it
+        # along with msg and kwargs made reports larger.
+        return {"msg": self.msg, "kwargs": self.kwargs}
 
 
 @attr.s(init=False)
@@ -71,35 +398,70 @@ class SubTestReport(TestReport):  # type: ignore[misc]
         return f"{domain} {self.sub_test_description()}"
 
     def sub_test_description(self) -> str:
-        parts = []
-        if isinstance(self.context.msg, str):
-            parts.append(f"[{self.context.msg}]")
-        if self.context.kwargs:
-            params_desc = ", ".join(
-                f"{k}={v!r}" for (k, v) in sorted(self.context.kwargs.items())
-            )
-            parts.append(f"({params_desc})")
-        return " ".join(parts) or "(<subtest>)"
+        return self.context.description()
 
     def _to_json(self) -> dict:
         data = super()._to_json()
         del data["context"]
+        batch = data.pop("_subtests_batch", None)
         data["_report_type"] = "SubTestReport"
-        data["_subtest.context"] = attr.asdict(self.context)
+        data["_subtest.context"] = self.context._to_json()
+        if batch:
+            data["_subtest.batch"] = [
+                json_delta(report._to_json(), data) for report in batch
+            ]
         return data
 
     @classmethod
     def _from_json(cls, reportdict: dict[str, Any]) -> SubTestReport:
+        batch = reportdict.get("_subtest.batch")
+        if batch is not None:
+            reportdict = {k: v for k, v in reportdict.items() if k != "_subtest.batch"}
         report = super()._from_json(reportdict)
         context_data = reportdict["_subtest.context"]
         report.context = SubTestContext(
             msg=context_data["msg"], kwargs=context_data["kwargs"]
         )
+        if batch is not None:
+            report._subtests_batch = [  # type: ignore[attr-defined]
+                cls._from_json(apply_json_delta(reportdict, delta)) for delta in batch
+            ]
         return report
 
     @classmethod
     def _from_test_report(cls, test_report: TestReport) -> SubTestReport:
-        return super()._from_json(test_report._to_json())
+        """
+        Create a SubTestReport taking over the attributes of ``test_report``.
+
+        This is equivalent to round-tripping ``test_report`` through ``_to_json()``/``_from_json()``,
+        but avoids serializing (and parsing back) the longrepr for every subtest.
+        """
+        report = cls.__new__(cls)
+        report.__dict__.update(test_report.__dict__)
+        report.sections = list(test_report.sections)
+        report.user_properties = list(test_report.user_properties)
+        return report
+
+
+def json_delta(data: dict[str, Any], base: dict[str, Any]) -> dict[str, Any]:
+    """
+    Return the items of ``data`` which differ from ``base``, with the keys of ``base`` missing
+    from ``data`` listed under ``"_subtest.unset"``.
+    """
+    delta = {k: v for k, v in data.items() if k not in base or base[k] != v}
+    unset = [k for k in base if k not in data]
+    if unset:
+        delta["_subtest.unset"] = unset
+    return delta
+
+
+def apply_json_delta(base: dict[str, Any], delta: dict[str, Any]) -> dict[str, Any]:
+    """Rebuild the data given to ``json_delta()`` from ``base`` and ``delta``."""
+    data = {**base, **delta}
+    for k in delta.get("_subtest.unset", ()):
+        del data[k]
+    data.pop("_subtest.unset", None)
+    return data
 
 
 def _addSkip(self: TestCaseFunction, testcase: TestCase, reason: str) -> None:
@@ -116,12 +478,7 @@ def _addSkip(self: TestCaseFunction, testcase: TestCase, reason: str) -> None:
         # For python < 3.11, we also need to check if `self.instance._outcome` is `None` (this happens if the test
         # class/method is decorated with `unittest.skip`, see #173).
         if sys.version_info < (3, 11) and self.instance._outcome is not None:
-            subtest_errors = [
-                x
-                for x, y in self.instance._outcome.errors
-                if isinstance(x, _SubTest) and y is not None
-            ]
-            if len(subtest_errors) == 0:
+            if LegacyOutcome.of(self).last_error_id is None:
                 self._originaladdSkip(testcase, reason)  # type: ignore[attr-defined]
         else:
             self._originaladdSkip(testcase, reason)  # type: ignore[attr-defined]
@@ -134,16 +491,21 @@ def _addSubTest(
     exc_info: tuple[type[BaseException], BaseException, TracebackType] | None,
 ) -> None:
     msg = test._message if isinstance(test._message, str) else None  # type: ignore[attr-defined]
+    # Recorded by `_subTest`, unless `TestCase.subTest` was not called through it.
+    call: UnitTestSubTestCall | None = getattr(test, "_subtests_call", None)
     call_info = make_call_info(
         ExceptionInfo(exc_info, _ispytest=True) if exc_info else None,
-        start=0,
-        stop=0,
-        duration=0,
+        start=call.start if call is not None else 0,
+        stop=call.stop if call is not None else 0,
+        duration=call.duration if call is not None else 0,
         when="call",
     )
     report = self.ihook.pytest_runtest_makereport(item=self, call=call_info)
     sub_report = SubTestReport._from_test_report(report)
     sub_report.context = SubTestContext(msg, dict(test.params))  # type: ignore[attr-defined]
+    if call is not None:
+        call.captured_output.update_report(sub_report)
+        call.captured_logs.update_report(sub_report)
     self.ihook.pytest_runtest_logreport(report=sub_report)
     if check_interactive_exception(call_info, sub_report):
         self.ihook.pytest_exception_interact(
@@ -152,30 +514,132 @@ def _addSubTest(
 
     # For python < 3.11: add non-subtest skips once all subtest failures are processed by # `_addSubTest`.
     if sys.version_info < (3, 11):
-        from unittest.case import _SubTest  # type: ignore[attr-defined]
-
-        non_subtest_skip = [
-            (x, y)
-            for x, y in self.instance._outcome.skipped
-            if not isinstance(x, _SubTest)
-        ]
-        subtest_errors = [
-            (x, y)
-            for x, y in self.instance._outcome.errors
-            if isinstance(x, _SubTest) and y is not None
-        ]
+        outcome = LegacyOutcome.of(self)
         # Check if we have non-subtest skips: if there are also sub failures, non-subtest skips are not treated in
         # `_addSubTest` and have to be added using `_originaladdSkip` after all subtest failures are processed.
-        if len(non_subtest_skip) > 0 and len(subtest_errors) > 0:
-            # Make sure we have processed the last subtest failure
-            last_subset_error = subtest_errors[-1]
-            if exc_info is last_subset_error[-1]:
-                # Add non-subtest skips (as they could not be treated in `_addSkip`)
-                for testcase, reason in non_subtest_skip:
-                    self._originaladdSkip(testcase, reason)  # type: ignore[attr-defined]
+        if outcome.non_subtest_skips and id(exc_info) == outcome.last_error_id:
+            # Add non-subtest skips (as they could not be treated in `_addSkip`)
+            non_subtest_skips, outcome.non_subtest_skips = outcome.non_subtest_skips, []
+            for testcase, reason in non_subtest_skips:
+                self._originaladdSkip(testcase, reason)  # type: ignore[attr-defined]
+
+
+@contextmanager
+def _subTest(self: TestCase, *args: Any, **params: Any) -> Iterator[None]:
+    """
+    Wraps `TestCase.subTest` to time the subtest and capture its output and log records, which
+    `_addSubTest` then adds to its report.
+    """
+    with self._originalsubTest(*args, **params):  # type: ignore[attr-defined]
+        outcome = self._outcome  # type: ignore[attr-defined]
+        item = outcome.result if outcome is not None else None
+        # `TestCase.subTest` only creates a subtest when the result supports them.
+        if (
+            not isinstance(item, TestCaseFunction)
+            or not outcome.result_supports_subtests
+        ):
+            yield
+            return
+        capture: UnitTestSubTestCapture | None = getattr(
+            item, "_subtests_unittest_capture", None
+        )
+        if capture is None:
+            capture = UnitTestSubTestCapture(item)
+            item._subtests_unittest_capture = capture  # type: ignore[attr-defined]
+        with capture.capturing() as call:
+            # Reported once the subtest exits on python 3.11+, after the test method on older versions.
+            self._subtest._subtests_call = call  # type: ignore[attr-defined]
+            yield
+
+
+@attr.s(slots=True)
+class LegacyOutcome:
+    """
+    For python < 3.11: what `_addSkip` and `_addSubTest` need to know about the outcome of a unittest test.
+
+    unittest only feeds the outcome to the result once the test method finished, so it does not change anymore
+    during the callbacks and is scanned once per test, instead of once per callback, which was quadratic in the
+    number of subtests.
+    """
+
+    outcome: weakref.ref[Any] = attr.ib()
+    # `id()` of the `exc_info` of the last subtest failure, which the outcome keeps alive.
+    last_error_id: int | None = attr.ib()
+    # Only kept if there are subtest failures, until the last one is processed.
+    non_subtest_skips: list[tuple[TestCase, str]] = attr.ib()
+
+    @classmethod
+    def of(cls, item: TestCaseFunction) -> LegacyOutcome:
+        from unittest.case import _SubTest  # type: ignore[attr-defined]
+
+        outcome = item.instance._outcome
+        legacy_outcome: LegacyOutcome | None = getattr(
+            item, "_subtests_legacy_outcome", None
+        )
+        if legacy_outcome is None or legacy_outcome.outcome() is not outcome:
+            last_error = None
+            for x, y in outcome.errors:
+                if isinstance(x, _SubTest) and y is not None:
+                    last_error = y
+            non_subtest_skips = []
+            if last_error is not None:
+                non_subtest_skips = [
+                    (x, y) for x, y in outcome.skipped if not isinstance(x, _SubTest)
+                ]
+            legacy_outcome = cls(
+                weakref.ref(outcome),
+                id(last_error) if last_error is not None else None,
+                non_subtest_skips,
+            )
+            item._subtests_legacy_outcome = legacy_outcome  # type: ignore[attr-defined]
+        return legacy_outcome
 
 
 def pytest_configure(config: pytest.Config) -> None:
+    if config.getoption("subtests_shard", None) == "auto" and config.getoption(
+        "dist", "no"
+    ) not in ("no", "each"):
+        # Other distribution modes give each test to a single worker, which would only run its
+        # share of the subtests.
+        raise pytest.UsageError("--subtests-shard=auto requires --dist each")
+    # Also needed without --subtests-aggregate, for the passing checks of subtests.check_all().
+    config.pluginmanager.register(AggregatedStats(config), "subtests-aggregated")
+    if config.getoption("subtests_xdist_batch", 1) > 1 and not hasattr(
+        config, "workerinput"
+    ):
+        config.pluginmanager.register(BatchedReports(config), "subtests-batched")
+    if config.getoption("subtests_durations", None) is not None and not hasattr(
+        config, "workerinput"
+    ):
+        config.pluginmanager.register(SubTestsDurations(config), "subtests-durations")
+    if memory_tracing_enabled(config):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            config.add_cleanup(tracemalloc.stop)
+        if not hasattr(config, "workerinput"):
+            config.pluginmanager.register(
+                SubTestsMemoryStats(config), "subtests-memory"
+            )
+    if getattr(config, "cache", None) is not None:
+        config.pluginmanager.register(SubTestsLastFailed(config), "subtests-lastfailed")
+    if (
+        config.getoption("subtests_progress", "letters") == "counter"
+        and config.getoption("verbose", 0) <= 0
+        and not hasattr(config, "workerinput")
+    ):
+        config.pluginmanager.register(SubTestsProgress(config), "subtests-progress")
+    if config.getoption("subtests_retain", "all") == "failed" and not hasattr(
+        config, "workerinput"
+    ):
+        config.pluginmanager.register(RetainFailedReports(config), "subtests-retain")
+    if config.getoption("subtests_junitxml", None) and not hasattr(
+        config, "workerinput"
+    ):
+        config.pluginmanager.register(
+            SubTestsJUnitXML(config, config.getoption("subtests_junitxml")),
+            "subtests-junitxml",
+        )
+
     TestCaseFunction.addSubTest = _addSubTest  # type: ignore[attr-defined]
     TestCaseFunction.failfast = False  # type: ignore[attr-defined]
     # This condition is to prevent `TestCaseFunction._originaladdSkip` being assigned again in a subprocess from a
@@ -185,6 +649,10 @@ def pytest_configure(config: pytest.Config) -> None:
     if not hasattr(TestCaseFunction, "_originaladdSkip"):
         TestCaseFunction._originaladdSkip = TestCaseFunction.addSkip  # type: ignore[attr-defined]
     TestCaseFunction.addSkip = _addSkip  # type: ignore[method-assign]
+    # Same guard as for `_originaladdSkip`.
+    if not hasattr(TestCase, "_originalsubTest"):
+        TestCase._originalsubTest = TestCase.subTest  # type: ignore[attr-defined]
+    TestCase.subTest = _subTest  # type: ignore[method-assign]
 
     # Hack (#86): the terminal does not know about the "subtests"
     # status, so it will by default turn the output to yellow.
@@ -216,6 +684,9 @@ def pytest_unconfigure() -> None:
     if hasattr(TestCaseFunction, "_originaladdSkip"):
         TestCaseFunction.addSkip = TestCaseFunction._originaladdSkip  # type: ignore[method-assign]
         del TestCaseFunction._originaladdSkip
+    if hasattr(TestCase, "_originalsubTest"):
+        TestCase.subTest = TestCase._originalsubTest  # type: ignore[method-assign]
+        del TestCase._originalsubTest
 
 
 @pytest.fixture
@@ -225,7 +696,77 @@ def subtests(request: SubRequest) -> Generator[SubTests, None, None]:
         suspend_capture_ctx = capmam.global_and_fixture_disabled
     else:
         suspend_capture_ctx = nullcontext
-    yield SubTests(request.node.ihook, suspend_capture_ctx, request)
+    if request.config.getoption("subtests_shared_capture"):
+        shared_capture = SharedOutputCapture(request)
+    else:
+        shared_capture = None
+    logging_plugin = request.config.pluginmanager.getplugin("logging-plugin")
+    if logging_plugin is not None:
+        log_capture = SharedLogCapture(logging_plugin.formatter)
+    else:
+        log_capture = None
+    # Passing subtests of an xfail test are reported as xpassed, so they are not aggregated.
+    if (
+        request.config.getoption("subtests_aggregate")
+        and request.node.get_closest_marker("xfail") is None
+    ):
+        aggregated = AggregatedPasses()
+    else:
+        aggregated = None
+    if request.config.getoption("subtests_profile", False):
+        profiler = SubTestsProfiler(
+            Path(
+                request.config.getoption("subtests_profile_dir"),
+                profile_file_name(request.node),
+            ),
+            request.config.getoption("subtests_profile_filter"),
+            request.config.getoption("subtests_durations_min"),
+        )
+    else:
+        profiler = None
+    lastfailed_plugin = request.config.pluginmanager.get_plugin("subtests-lastfailed")
+    if lastfailed_plugin is not None:
+        last_failed = lastfailed_plugin.last_failed(request.node.nodeid)
+    else:
+        last_failed = None
+    if memory_tracing_enabled(request.config):
+        memory_tracer = SubTestsMemoryTracer(
+            request.config.getoption("subtests_memory_budget")
+        )
+    else:
+        memory_tracer = None
+    subtests = SubTests(
+        request.node.ihook,
+        suspend_capture_ctx,
+        request,
+        shared_capture,
+        log_capture,
+        aggregated,
+        get_shard(request.config),
+        # Reports are only batched when sent by pytest-xdist workers.
+        (
+            request.config.getoption("subtests_xdist_batch", 1)
+            if hasattr(request.config, "workerinput")
+            else 1
+        ),
+        profiler,
+        memory_tracer,
+        last_failed,
+        maxfail=request.config.getoption("subtests_maxfail"),
+        timeout=request.config.getoption("subtests_timeout"),
+        capture=request.config.getoption("subtests_capture") != "no",
+    )
+    try:
+        yield subtests
+    finally:
+        if shared_capture is not None:
+            shared_capture.close()
+        if log_capture is not None:
+            log_capture.close()
+        if profiler is not None:
+            profiler.dump()
+        # Usually done once the test function returns, but subtests may run in fixtures too.
+        subtests._flush()
 
 
 @attr.s
@@ -233,6 +774,22 @@ class SubTests:
     ihook: pluggy.HookRelay = attr.ib()
     suspend_capture_ctx: Callable[[], ContextManager] = attr.ib()
     request: SubRequest = attr.ib()
+    _shared_capture: SharedOutputCapture | None = attr.ib(default=None, repr=False)
+    _log_capture: SharedLogCapture | None = attr.ib(default=None, repr=False)
+    _aggregated: AggregatedPasses | None = attr.ib(default=None, repr=False)
+    _shard: tuple[int, int] | None = attr.ib(default=None, repr=False)
+    _batch_size: int = attr.ib(default=1, repr=False)
+    _profiler: SubTestsProfiler | None = attr.ib(default=None, repr=False)
+    _memory_tracer: SubTestsMemoryTracer | None = attr.ib(default=None, repr=False)
+    _last_failed: LastFailedSubTests | None = attr.ib(default=None, repr=False)
+    maxfail: int | None = attr.ib(default=None, kw_only=True)
+    timeout: float | None = attr.ib(default=None, kw_only=True)
+    capture: bool = attr.ib(default=True, kw_only=True)
+    _batch: list[SubTestReport] = attr.ib(init=False, factory=list, repr=False)
+    _failures: int = attr.ib(init=False, default=0, repr=False)
+    _skipped_after_maxfail: int = attr.ib(init=False, default=0, repr=False)
+    # Number of subtests created so far, which assigns them to shards (--subtests-shard).
+    _created: int = attr.ib(init=False, default=0, repr=False)
 
     @property
     def item(self) -> pytest.Item:
@@ -241,26 +798,544 @@ class SubTests:
     def test(
         self,
         msg: str | None = None,
+        *,
+        maxfail: int | None = None,
+        timeout: float | None = None,
+        capture: bool | None = None,
         **kwargs: Any,
     ) -> _SubTestContextManager:
         """
         Context manager for subtests, capturing exceptions raised inside the subtest scope and handling
         them through the pytest machinery.
 
+        The subtest is skipped once ``maxfail`` subtests of the test failed, unless it is 0;
+        ``maxfail`` defaults to ``subtests.maxfail``, set by ``--subtests-maxfail``. It is also
+        skipped if it is not run by this process (``--subtests-shard``) or this time
+        (``--subtests-lf``). The body of a skipped subtest still runs, so skipping it saves no time
+        unless the body checks the ``skipped`` attribute of the object returned when entering the
+        subtest, to be left right away. A skipped subtest is not reported, unless it is skipped by
+        ``--subtests-lf`` and its body raises. ``iterate()``, ``map()`` and ``gather()`` do not run
+        the subtests they skip.
+
+        The subtest is interrupted and fails if it runs for more than ``timeout`` seconds, which
+        defaults to ``subtests.timeout``, set by ``--subtests-timeout``. The timeout uses ``SIGALRM``,
+        so it is only applied to ``with`` blocks run in the main thread, on platforms other than
+        Windows.
+
+        With ``capture=False``, which defaults to ``subtests.capture``, set to false by
+        ``--subtests-capture=no``, the output and log records of the subtest are not captured
+        separately, they go to the test's own capture: this saves the cost of starting and stopping
+        the captures for subtests which do not print or log.
+
         Usage:
 
         .. code-block:: python
 
             with subtests.test(msg="subtest"):
                 assert 1 == 1
+
+            for i in range(100):
+                with subtests.test(i=i) as subtest:
+                    if subtest.skipped:
+                        continue
+                    assert check(i)
+        """
+        return _SubTestContextManager(self, msg, kwargs, maxfail, timeout, capture)
+
+    def iterate(
+        self,
+        iterable: Iterable[Any],
+        *,
+        id: Callable[[Any], Any] | None = None,
+        kwargs: Callable[[Any], Mapping[str, Any]] | None = None,
+        msg: str | None = None,
+    ) -> Iterator[_SubTestContextManager]:
+        """
+        Pull the items of ``iterable`` one at a time, yielding a subtest for each of them, which
+        returns the item when entered.
+
+        The parameters of each subtest are the id returned by ``id(item)``, as its ``id`` parameter,
+        and the parameters returned by ``kwargs(item)``, or its position as its ``index`` parameter
+        if neither is given. Parameters which are neither short strings nor numbers are replaced by a
+        short representation, so that the reports do not keep the items alive, and only the current
+        item is kept in memory: large datasets can be streamed through a test.
+
+        Items not run by this process (``--subtests-shard``) or this time (``--subtests-lf``), or
+        once ``subtests.maxfail`` subtests failed, are pulled but not yielded. Items are run in the
+        order of ``iterable``, even with ``--subtests-ff``.
+
+        Usage:
+
+        .. code-block:: python
+
+            for subtest in subtests.iterate(read_records(path), id=lambda record: record["name"]):
+                with subtest as record:
+                    assert process(record["input"]) == record["expected"]
+        """
+        filtered = self._shard is not None or self._last_failed is not None
+        for index, item in enumerate(iterable):
+            params: dict[str, Any] = {}
+            if id is not None:
+                params["id"] = compact_id(id(item))
+            if kwargs is not None:
+                params.update((k, compact_id(v)) for k, v in kwargs(item).items())
+            if id is None and kwargs is None:
+                params["index"] = index
+            if filtered and self._skips(SubTestContext(msg, params)):
+                continue
+            if self.maxfail and self._failures >= self.maxfail:
+                # Only counted, to be reported once the test finishes.
+                self._skipped_after_maxfail += 1
+                continue
+            yield _SubTestContextManager(self, msg, params, item=item)
+
+    def map(
+        self,
+        fn: Callable[[Any], Any],
+        iterable: Iterable[Any],
+        *,
+        msg: str | None = None,
+        max_workers: int | None = None,
+        executor: Literal["thread", "process"] = "thread",
+    ) -> list[Any]:
+        """
+        Call ``fn`` for each item of ``iterable`` concurrently on a thread pool, each call being
+        reported as a subtest with the item as its ``item`` parameter.
+
+        The subtests are reported from the calling thread, in the order of ``iterable``. Returns the
+        results of the calls, with ``None`` for the calls that raised an exception.
+
+        With the default ``executor="thread"``, output and log records of the calls are not captured
+        per subtest, they go to the test's own capture. A call running for more than
+        ``subtests.timeout`` seconds is reported as failed with the stack of its thread. As threads
+        cannot be interrupted, it is left running, and may still have side effects while the next
+        tests run; the threads are daemon threads, so that it does not keep pytest from exiting.
+
+        With ``executor="process"``, the calls run on a process pool instead, for CPU bound checks:
+        the workers are spawned, so ``fn`` must be importable from them, and the items and the
+        results must be picklable. Each worker imports the module defining ``fn`` again, running
+        its module-level code. The output and log records of each call
+        are captured in the worker process, which sends back the report of the subtest, and calls
+        running for more than ``subtests.timeout`` seconds are interrupted there.
+
+        Usage:
+
+        .. code-block:: python
+
+            def check(path):
+                assert load(path) is not None
+
+            subtests.map(check, paths, max_workers=8)
+        """
+        __tracebackhide__ = True
+        if executor == "process":
+            return self._map_in_processes(fn, iterable, msg, max_workers)
+        elif executor != "thread":
+            raise ValueError(
+                f"executor must be 'thread' or 'process', got {executor!r}"
+            )
+
+        items = list(iterable)
+        contexts = [SubTestContext(msg, {"item": item}) for item in items]
+        order = self._run_order(contexts)
+        results: list[Any] = [None] * len(items)
+        pool = DaemonThreadPool(max_workers)
+        timed_out = False
+        try:
+            calls = [ThreadCall(partial(fn, items[index])) for index in order]
+            futures = [pool.submit(call) for call in calls]
+            for index, call, future in zip(order, calls, futures):
+                call_info = call.wait(future, self.timeout)
+                timed_out = timed_out or not future.done()
+                if call_info.excinfo is None:
+                    results[index] = call_info.result
+                self._report_call(call_info, contexts[index])
+                if call_info.excinfo is not None and self.request.session.shouldfail:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    raise call_info.excinfo.value
+        finally:
+            # The calls which timed out are not waited for.
+            pool.shutdown(wait=not timed_out)
+        return results
+
+    async def gather(
+        self,
+        *aws: Awaitable[Any],
+        limit: int | None = None,
+        msg: str | None = None,
+    ) -> list[Any]:
+        """
+        Await ``aws`` concurrently on the running event loop, each awaitable being reported as a
+        subtest with its position as its ``index`` parameter.
+
+        At most ``limit`` awaitables are awaited at the same time, if given. The subtests are reported
+        in the order of ``aws``, as they finish. Returns the results of the awaitables, with ``None``
+        for the ones that raised an exception. Awaitables running for more than ``subtests.timeout``
+        seconds are cancelled and reported as failed, with the stack where they were suspended.
+
+        Output and log records of the awaitables are not captured per subtest, they go to the test's
+        own capture.
+
+        Usage:
+
+        .. code-block:: python
+
+            async def check(url):
+                response = await client.get(url)
+                assert response.status == 200
+
+            await subtests.gather(*(check(url) for url in urls), limit=20)
+        """
+        __tracebackhide__ = True
+        # Imported when used, like the modules only needed by map(executor="process") and
+        # --subtests-profile, so that they do not slow down the start of every session.
+        import asyncio
+
+        contexts = [SubTestContext(msg, {"index": index}) for index in range(len(aws))]
+        order = self._run_order(contexts)
+        for index in set(range(len(aws))).difference(order):
+            aw = aws[index]
+            if asyncio.iscoroutine(aw):
+                # Not awaited, closed to avoid a "never awaited" warning.
+                aw.close()
+        semaphore = asyncio.Semaphore(limit) if limit is not None else None
+        tasks = {
+            index: asyncio.ensure_future(
+                call_awaitable(aws[index], semaphore, self.timeout)
+            )
+            for index in order
+        }
+        results: list[Any] = [None] * len(aws)
+        try:
+            for index, task in tasks.items():
+                results[index], call_info = await task
+                self._report_call(call_info, contexts[index])
+                if call_info.excinfo is not None and self.request.session.shouldfail:
+                    raise call_info.excinfo.value
+        finally:
+            pending = [task for task in tasks.values() if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+        return results
+
+    def check_all(
+        self,
+        actual: Any,
+        expected: Any,
+        *,
+        ids: Any = None,
+        rtol: float = 0.0,
+        atol: float = 0.0,
+        msg: str | None = None,
+    ) -> int:
+        """
+        Compare ``actual`` to ``expected`` element by element, each mismatch being reported as a
+        failed subtest with its index as its ``index`` parameter, or ``ids[index]`` as its ``id``
+        parameter, and the matching elements as a single passing subtest counting them. Returns the
+        number of mismatches.
+
+        Elements are compared with ``==``, or with ``math.isclose()`` if ``rtol`` or ``atol`` is
+        given. A scalar ``expected`` is compared to every element. NumPy arrays are compared in one
+        vectorized step (with ``numpy.isclose()`` given a tolerance), broadcasting ``expected``, and
+        their indexes are tuples if they have several dimensions.
+
+        Usage:
+
+        .. code-block:: python
+
+            subtests.check_all(model.predict(inputs), expected, ids=names, rtol=1e-6)
+        """
+        __tracebackhide__ = True
+        start = time.time()
+        precise_start = time.perf_counter()
+        passed, failures = compare_all(actual, expected, ids, rtol, atol)
+        return self._record(failures, lambda: passed, msg, start, precise_start)
+
+    def record_batch(
+        self,
+        results: Iterable[tuple[Mapping[str, Any], str | None]],
+        *,
+        msg: str | None = None,
+    ) -> int:
+        """
+        Report the results of checks made in bulk, given as pairs of the parameters of each check and
+        ``None`` if it passed, else the message of its failure.
+
+        Each failed check is reported as a failed subtest, and the passing checks as a single passing
+        subtest counting them. Returns the number of failed checks.
+
+        Usage:
+
+        .. code-block:: python
+
+            subtests.record_batch(
+                ({"name": name}, None if valid else f"{name} is invalid")
+                for name, valid in zip(names, validate(records))
+            )
+        """
+        __tracebackhide__ = True
+        start = time.time()
+        precise_start = time.perf_counter()
+        passed = 0
+
+        def failures() -> Iterator[tuple[Mapping[str, Any], str]]:
+            nonlocal passed
+            for kwargs, failure in results:
+                if failure is None:
+                    passed += 1
+                else:
+                    yield kwargs, failure
+
+        return self._record(failures(), lambda: passed, msg, start, precise_start)
+
+    def _record(
+        self,
+        failures: Iterable[tuple[Mapping[str, Any], str]],
+        passed: Callable[[], int],
+        msg: str | None,
+        start: float,
+        precise_start: float,
+    ) -> int:
+        """
+        Report ``failures`` as failed subtests, then the number of passing checks returned by
+        ``passed()`` once they are consumed (``check_all()``, ``record_batch()``).
+        """
+        __tracebackhide__ = True
+        failed = 0
+        for kwargs, failure in failures:
+            failed += 1
+            if self.maxfail and self._failures >= self.maxfail:
+                # Only counted, to be reported once the test finishes.
+                self._skipped_after_maxfail += 1
+                continue
+            exc_info = check_failure(failure)
+            now = time.time()
+            call_info = make_call_info(
+                exc_info, start=now, stop=now, duration=0, when="call"
+            )
+            sub_report = self._make_report(call_info, SubTestContext(msg, dict(kwargs)))
+            sub_report.sections = []
+            self._log_report(sub_report, call_info)
+            if self.request.session.shouldfail:
+                raise exc_info.value
+
+        count = passed()
+        if count > 0:
+            passes = AggregatedPasses()
+            passes.add(start, time.time(), time.perf_counter() - precise_start, count)
+            if self._aggregated is not None:
+                self._aggregated.add(passes.start, passes.stop, passes.duration, count)
+            else:
+                self._report_passes(passes, msg)
+        return failed
+
+    def _map_in_processes(
+        self,
+        fn: Callable[[Any], Any],
+        iterable: Iterable[Any],
+        msg: str | None,
+        max_workers: int | None,
+    ) -> list[Any]:
+        __tracebackhide__ = True
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        process_call = ProcessCall.from_item(self.item, msg, self.timeout)
+        items = list(iterable)
+        order = self._run_order([SubTestContext(msg, {"item": item}) for item in items])
+        results: list[Any] = [None] * len(items)
+        # Forking a process running threads (pytest-xdist workers, the thread pool of map()) can
+        # deadlock the child, so the workers are started from a fresh interpreter instead.
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=import_rewritten_module,
+            initargs=(rewritten_module(fn),),
+        ) as executor:
+            calls = executor.map(
+                partial(run_process_call, process_call, fn),
+                [items[index] for index in order],
+            )
+            for index, (result, data) in zip(order, calls):
+                results[index] = result
+                sub_report = SubTestReport._from_json(data)
+                call_info = make_call_info(
+                    None,
+                    start=sub_report.start,
+                    stop=sub_report.stop,
+                    duration=sub_report.duration,
+                    when="call",
+                )
+                if sub_report.passed and self._aggregated is not None:
+                    self._aggregated.add(
+                        sub_report.start, sub_report.stop, sub_report.duration
+                    )
+                else:
+                    self._log_report(sub_report, call_info)
+                if sub_report.failed and self.request.session.shouldfail:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    pytest.fail(
+                        f"{sub_report.sub_test_description()} failed", pytrace=False
+                    )
+        return results
+
+    def _skips(self, context: SubTestContext) -> bool:
+        """
+        Whether the subtest is not run by this process (``--subtests-shard``) or this time
+        (``--subtests-lf``).
+        """
+        return self._skipped_by(context) is not None
+
+    def _skipped_by(self, context: SubTestContext) -> Literal["shard", "lf"] | None:
+        """
+        Return why the subtest is not run: ``"shard"`` if it is run by another process
+        (``--subtests-shard``), ``"lf"`` if it did not fail in the last run (``--subtests-lf``), or
+        ``None`` if it is run.
         """
-        return _SubTestContextManager(
-            self.ihook,
-            msg,
-            kwargs,
-            request=self.request,
-            suspend_capture_ctx=self.suspend_capture_ctx,
+        skipped_by: Literal["shard", "lf"] | None = None
+        if self._shard is not None:
+            index, count = self._shard
+            # The subtests of a test are dealt to the shards in turn, starting from a shard given by
+            # its node id so that tests with few subtests are spread too. Unlike their description,
+            # which may contain the address of an object, both are the same in every process.
+            created = self._created
+            self._created += 1
+            start = zlib.crc32(self.item.nodeid.encode("utf-8"))
+            if (start + created) % count != index:
+                skipped_by = "shard"
+        # Asked even for the subtests of other shards, to know the failed subtests still exist.
+        if (
+            self._last_failed is not None
+            and self._last_failed.skips(context)
+            and skipped_by is None
+        ):
+            skipped_by = "lf"
+        return skipped_by
+
+    def _run_order(self, contexts: list[SubTestContext]) -> list[int]:
+        """
+        Return the indexes of the subtests to run among ``contexts``, in the order in which to run
+        them (``--subtests-shard``, ``--subtests-lf``, ``--subtests-ff``).
+        """
+        if self._shard is None and self._last_failed is None:
+            return list(range(len(contexts)))
+        indexes = [
+            index for index, context in enumerate(contexts) if not self._skips(context)
+        ]
+        if self._last_failed is not None:
+            self._last_failed.sort(indexes, contexts)
+        return indexes
+
+    def _report_call(self, call_info: CallInfo, context: SubTestContext) -> None:
+        """Report a subtest executed outside of a ``test()`` block, without output capture."""
+        if call_info.excinfo is None and self._aggregated is not None:
+            self._aggregated.add(call_info.start, call_info.stop, call_info.duration)
+        else:
+            sub_report = self._make_report(call_info, context)
+            self._log_report(sub_report, call_info)
+
+    def _make_report(
+        self, call_info: CallInfo, context: SubTestContext
+    ) -> SubTestReport:
+        report = self.ihook.pytest_runtest_makereport(item=self.item, call=call_info)
+        sub_report = SubTestReport._from_test_report(report)
+        sub_report.context = context
+        return sub_report
+
+    def _log_report(self, sub_report: SubTestReport, call_info: CallInfo) -> None:
+        if sub_report.failed:
+            self._failures += 1
+        if self._batch_size > 1:
+            # Failures are never delayed, so --maxfail and --exitfirst are applied right away.
+            if not sub_report.failed:
+                self._batch.append(sub_report)
+                if len(self._batch) >= self._batch_size:
+                    self._send_batch()
+                return
+            self._send_batch()
+
+        with ExitStack() as stack:
+            if self._shared_capture is not None:
+                stack.enter_context(self._shared_capture.suspended())
+
+            with self.suspend_capture_ctx():
+                self.ihook.pytest_runtest_logreport(report=sub_report)
+
+            if check_interactive_exception(call_info, sub_report):
+                self.ihook.pytest_exception_interact(
+                    node=self.item, call=call_info, report=sub_report
+                )
+
+    def _send_batch(self) -> None:
+        """
+        Report the subtests batched so far (``--subtests-xdist-batch``): only the last report is
+        logged, carrying the others, which are logged again by ``BatchedReports`` on the controller.
+        """
+        if not self._batch:
+            return
+        *batch, carrier = self._batch
+        self._batch = []
+        carrier._subtests_batch = batch  # type: ignore[attr-defined]
+        with ExitStack() as stack:
+            if self._shared_capture is not None:
+                stack.enter_context(self._shared_capture.suspended())
+
+            with self.suspend_capture_ctx():
+                self.ihook.pytest_runtest_logreport(report=carrier)
+
+    def _flush(self) -> None:
+        """
+        Report the passing subtests aggregated (``--subtests-aggregate``), the subtests skipped
+        after ``maxfail`` failures, and the subtests batched (``--subtests-xdist-batch``) so far.
+        """
+        aggregated = self._aggregated
+        if aggregated is not None and aggregated.count > 0:
+            self._aggregated = AggregatedPasses()
+            self._report_passes(aggregated, None)
+        if self._skipped_after_maxfail:
+            self._report_skipped_after_maxfail()
+        self._send_batch()
+
+    def _report_passes(self, passes: AggregatedPasses, msg: str | None) -> None:
+        """Report passing subtests as a single subtest counting them."""
+        call_info = make_call_info(
+            None,
+            start=passes.start,
+            stop=passes.stop,
+            duration=passes.duration,
+            when="call",
+        )
+        description = f"{passes.count} passing subtests"
+        sub_report = self._make_report(
+            call_info,
+            SubTestContext(f"{msg}: {description}" if msg else description, {}),
+        )
+        # The summary does not carry the output captured by the test itself.
+        sub_report.sections = []
+        sub_report.subtests_aggregated = passes.count  # type: ignore[attr-defined]
+        self._log_report(sub_report, call_info)
+
+    def _report_skipped_after_maxfail(self) -> None:
+        try:
+            raise pytest.skip.Exception(
+                f"maxfail reached after {self._failures} failed subtests",
+                _use_item_location=True,
+            )
+        except pytest.skip.Exception:
+            exc_info = ExceptionInfo.from_current()
+        now = time.time()
+        call_info = make_call_info(
+            exc_info, start=now, stop=now, duration=0, when="call"
+        )
+        sub_report = self._make_report(
+            call_info,
+            SubTestContext(f"{self._skipped_after_maxfail} subtests skipped", {}),
         )
+        sub_report.sections = []
+        self._skipped_after_maxfail = 0
+        self._log_report(sub_report, call_info)
 
 
 @attr.s(auto_attribs=True)
@@ -274,26 +1349,89 @@ class _SubTestContextManager:
     in --exitfirst mode, so this was refactored into an explicit context manager class (#134).
     """
 
-    ihook: pluggy.HookRelay
+    subtests: SubTests
     msg: str | None
     kwargs: dict[str, Any]
-    suspend_capture_ctx: Callable[[], ContextManager]
-    request: SubRequest
+    maxfail: int | None = None
+    timeout: float | None = None
+    capture: bool | None = None
+    # Returned when entered instead of the context manager, for subtests.iterate(), which only
+    # yields the subtests to run.
+    item: Any = _NO_ITEM
+    # Whether the subtest is skipped: its body still runs, but is only reported if it raises, when
+    # it is skipped by --subtests-lf.
+    skipped: bool = attr.ib(init=False, default=False)
+
+    def __enter__(self) -> Any:
+        __tracebackhide__ = True
+        self._enter()
+        return self if self.item is _NO_ITEM else self.item
 
-    def __enter__(self) -> None:
+    def _enter(self, is_async: bool = False) -> None:
         __tracebackhide__ = True
+        subtests = self.subtests
+        # Immutable, so shared by the report and the plugins, which cache its description.
+        self._context = SubTestContext(self.msg, self.kwargs)
+        self._skipped_by: Literal["shard", "lf", "maxfail"] | None = None
+        if self.item is _NO_ITEM:
+            # The body of a skipped subtest cannot be skipped, so it is still set up as usual. If it
+            # raises, it is reported when skipped by --subtests-lf, as it ran anyway; the shard
+            # running the subtest reports it otherwise, and it is counted in the subtests skipped
+            # after maxfail failures.
+            if subtests._shard is not None or subtests._last_failed is not None:
+                self._skipped_by = subtests._skipped_by(self._context)
+            maxfail = self.maxfail if self.maxfail is not None else subtests.maxfail
+            if self._skipped_by is None and maxfail and subtests._failures >= maxfail:
+                # Only counted, to be reported once the test finishes.
+                subtests._skipped_after_maxfail += 1
+                self._skipped_by = "maxfail"
+            self.skipped = self._skipped_by is not None
 
         self._start = time.time()
         self._precise_start = time.perf_counter()
         self._exc_info = None
 
+        shared_capture = self.subtests._shared_capture
+        log_capture = self.subtests._log_capture
+        capture = self.capture if self.capture is not None else subtests.capture
         self._exit_stack = ExitStack()
-        self._captured_output = self._exit_stack.enter_context(
-            capturing_output(self.request)
-        )
-        self._captured_logs = self._exit_stack.enter_context(
-            capturing_logs(self.request)
-        )
+        if not capture:
+            self._captured_output = Captured()
+        elif shared_capture is not None:
+            self._captured_output = self._exit_stack.enter_context(
+                shared_capture.capturing()
+            )
+        else:
+            self._captured_output = self._exit_stack.enter_context(
+                capturing_output(self.subtests.request)
+            )
+        self._captured_logs: CapturedLogs | NullCapturedLogs
+        if capture and log_capture is not None:
+            self._captured_logs = self._exit_stack.enter_context(
+                log_capture.capturing()
+            )
+        else:
+            self._captured_logs = NullCapturedLogs()
+        self._memory_usage: MemoryUsage | None = None
+        if self.subtests._memory_tracer is not None:
+            self._memory_usage = self._exit_stack.enter_context(
+                self.subtests._memory_tracer.tracing()
+            )
+        # Entered after the captures, so that capturing the output is not profiled.
+        self._profile: SubTestProfile | NullSubTestProfile
+        if self.subtests._profiler is not None:
+            self._profile = self._exit_stack.enter_context(
+                self.subtests._profiler.profiling(self._context)
+            )
+        else:
+            self._profile = NullSubTestProfile()
+        # Cancelled first thing when exiting, so that the alarm cannot interrupt the bookkeeping of
+        # the subtest. The signal would interrupt the event loop rather than the body of an
+        # "async with" block.
+        self._alarm = ExitStack()
+        timeout = self.timeout if self.timeout is not None else subtests.timeout
+        if timeout is not None and not is_async:
+            self._alarm.enter_context(alarm(timeout))
 
     def __exit__(
         self,
@@ -302,6 +1440,15 @@ class _SubTestContextManager:
         exc_tb: TracebackType | None,
     ) -> bool:
         __tracebackhide__ = True
+        self._alarm.close()
+        subtests = self.subtests
+        if self.skipped:
+            if exc_val is None or self._skipped_by != "lf":
+                # Its body returned early or ran without failing, or its failure is reported by
+                # another shard, or counted in the subtests skipped after maxfail failures.
+                self._exit_stack.close()
+                return not isinstance(exc_val, (Exit, KeyboardInterrupt))
+        exc_info: ExceptionInfo[BaseException] | None
         try:
             if exc_val is not None:
                 exc_info = ExceptionInfo.from_exception(exc_val)
@@ -314,31 +1461,878 @@ class _SubTestContextManager:
         duration = precise_stop - self._precise_start
         stop = time.time()
 
-        call_info = make_call_info(
-            exc_info, start=self._start, stop=stop, duration=duration, when="call"
-        )
-        report = self.ihook.pytest_runtest_makereport(
-            item=self.request.node, call=call_info
-        )
-        sub_report = SubTestReport._from_test_report(report)
-        sub_report.context = SubTestContext(self.msg, self.kwargs.copy())
+        if (
+            exc_info is None
+            and self._memory_usage is not None
+            and self._memory_usage.over_budget()
+        ):
+            exc_info = self._memory_usage.budget_failure()
 
-        self._captured_output.update_report(sub_report)
-        self._captured_logs.update_report(sub_report)
+        if exc_info is None and subtests._aggregated is not None:
+            subtests._aggregated.add(self._start, stop, duration)
+        else:
+            call_info = make_call_info(
+                exc_info, start=self._start, stop=stop, duration=duration, when="call"
+            )
+            sub_report = subtests._make_report(call_info, self._context)
 
-        with self.suspend_capture_ctx():
-            self.ihook.pytest_runtest_logreport(report=sub_report)
+            self._captured_output.update_report(sub_report)
+            self._captured_logs.update_report(sub_report)
+            self._profile.update_report(sub_report)
+            if self._memory_usage is not None:
+                self._memory_usage.update_report(sub_report)
 
-        if check_interactive_exception(call_info, sub_report):
-            self.ihook.pytest_exception_interact(
-                node=self.request.node, call=call_info, report=sub_report
-            )
+            subtests._log_report(sub_report, call_info)
 
         if exc_val is not None:
-            if self.request.session.shouldfail:
+            if subtests.request.session.shouldfail:
                 return False
         return True
 
+    async def __aenter__(self) -> Any:
+        __tracebackhide__ = True
+        self._enter(is_async=True)
+        return self if self.item is _NO_ITEM else self.item
+
+    async def __aexit__(
+        self,
+        exc_type: type[Exception] | None,
+        exc_val: Exception | None,
+        exc_tb: TracebackType | None,
+    ) -> bool:
+        __tracebackhide__ = True
+        return self.__exit__(exc_type, exc_val, exc_tb)
+
+
+@attr.s
+class AggregatedPasses:
+    """Passing subtests counted but not reported yet (``--subtests-aggregate``)."""
+
+    count = attr.ib(default=0, type=int)
+    start = attr.ib(default=0.0, type=float)
+    stop = attr.ib(default=0.0, type=float)
+    duration = attr.ib(default=0.0, type=float)
+
+    def add(self, start: float, stop: float, duration: float, count: int = 1) -> None:
+        if self.count == 0:
+            self.start = start
+        self.count += count
+        self.stop = stop
+        self.duration += duration
+
+
+class AggregatedStats:
+    """
+    Makes the terminal summary count each passing subtest of an aggregated report
+    (``--subtests-aggregate``), as if they had been reported individually.
+    """
+
+    def __init__(self, config: pytest.Config) -> None:
+        self._config = config
+
+    def pytest_runtest_logreport(self, report: pytest.TestReport) -> None:
+        count = getattr(report, "subtests_aggregated", 0)
+        terminalreporter = self._config.pluginmanager.get_plugin("terminalreporter")
+        if count > 1 and terminalreporter is not None:
+            category, _, _ = self._config.hook.pytest_report_teststatus(
+                report=report, config=self._config
+            )
+            if category:
+                # The terminal reporter already added the report once.
+                terminalreporter.stats.setdefault(category, []).extend(
+                    [report] * (count - 1)
+                )
+
+
+class BatchedReports:
+    """
+    Logs the subtest reports sent in a batch by a pytest-xdist worker (``--subtests-xdist-batch``),
+    before the report carrying them.
+    """
+
+    def __init__(self, config: pytest.Config) -> None:
+        self._config = config
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_logreport(self, report: pytest.TestReport) -> None:
+        batch = getattr(report, "_subtests_batch", None)
+        if batch:
+            del report._subtests_batch
+            for batched_report in batch:
+                self._config.hook.pytest_runtest_logreport(report=batched_report)
+
+
+class RetainFailedReports:
+    """
+    Replaces the reports of passed and skipped subtests kept in the terminal reporter's stats
+    with a ``RetainedSubTestReport`` once they are reported (``--subtests-retain=failed``).
+    """
+
+    # Categories of passed and skipped subtests in pytest_report_teststatus().
+    categories = ("subtests passed", "skipped", "")
+
+    def __init__(self, config: pytest.Config) -> None:
+        self._config = config
+
+    # After the terminal reporter and AggregatedStats added the report.
+    @pytest.hookimpl(trylast=True)
+    def pytest_runtest_logreport(self, report: pytest.TestReport) -> None:
+        if (
+            not isinstance(report, SubTestReport)
+            or report.failed
+            or hasattr(report, "wasxfail")
+        ):
+            return
+        terminalreporter = self._config.pluginmanager.get_plugin("terminalreporter")
+        if terminalreporter is None:
+            return
+        retained = RetainedSubTestReport(report)
+        for category in self.categories:
+            reports = terminalreporter.stats.get(category)
+            index = len(reports) if reports else 0
+            while index and reports[index - 1] is report:
+                index -= 1
+                reports[index] = retained
+
+
+class RetainedSubTestReport:
+    """
+    What is kept of the report of a passed or skipped subtest (``--subtests-retain=failed``).
+
+    Not a ``BaseReport``, whose instances have a ``__dict__``: only provides what the terminal
+    reporter needs for the summary, ``-rs``, ``-rp`` and ``-rP``.
+    """
+
+    __slots__ = ("nodeid", "location", "description", "outcome", "duration", "longrepr")
+
+    when = "call"
+    sections: ClassVar[list[tuple[str, str]]] = []
+    count_towards_summary = True
+
+    def __init__(self, report: SubTestReport) -> None:
+        self.nodeid = report.nodeid
+        self.location = report.location
+        self.description = report.sub_test_description()
+        self.outcome = report.outcome
+        self.duration = report.duration
+        # The location and reason of a skip, for the short test summary.
+        self.longrepr = report.longrepr if report.skipped else None
+
+    @property
+    def passed(self) -> bool:
+        return self.outcome == "passed"
+
+    @property
+    def failed(self) -> bool:
+        return self.outcome == "failed"
+
+    @property
+    def skipped(self) -> bool:
+        return self.outcome == "skipped"
+
+    @property
+    def head_line(self) -> str:
+        _, _, domain = self.location
+        return f"{domain} {self.description}"
+
+    def sub_test_description(self) -> str:
+        return self.description
+
+    def _get_verbose_word_with_markup(
+        self, config: pytest.Config, default_markup: Mapping[str, bool]
+    ) -> tuple[str, Mapping[str, bool]]:
+        # Always a string, given by pytest_report_teststatus() below.
+        return self._get_verbose_word(config), default_markup
+
+    def _get_verbose_word(self, config: pytest.Config) -> str:
+        # Used instead of _get_verbose_word_with_markup() by pytest < 8.
+        _, _, verbose = config.hook.pytest_report_teststatus(report=self, config=config)
+        return verbose
+
+
+LASTFAILED_CACHE_KEY = "subtests/lastfailed"
+
+
+@attr.s
+class LastFailedSubTests:
+    """
+    The subtests of a test which failed in the last run, identified by their description
+    (``--subtests-lf``, ``--subtests-ff``).
+    """
+
+    descriptions: frozenset[str] = attr.ib()
+    only_failed: bool = attr.ib()
+    failed_first: bool = attr.ib()
+    # Whether any of them was created by the test in this run.
+    found: bool = attr.ib(init=False, default=False)
+
+    def skips(self, context: SubTestContext) -> bool:
+        if context.description() in self.descriptions:
+            self.found = True
+            return False
+        return self.only_failed
+
+    def sort(self, indexes: list[int], contexts: list[SubTestContext]) -> None:
+        """Sort the ``indexes`` of ``contexts`` to run the failed subtests first, if enabled."""
+        if self.failed_first:
+            indexes.sort(
+                key=lambda index: contexts[index].description() not in self.descriptions
+            )
+
+
+class SubTestsLastFailed:
+    """
+    Records the subtests which failed in the cache, to run them again with ``--subtests-lf``
+    and ``--subtests-ff``.
+
+    Like ``--lf``, the subtests of a test are all run if none of them failed in the last run. If
+    none of those which failed exists anymore, they are forgotten when the session finishes, so
+    that the test runs all its subtests the next time.
+    """
+
+    def __init__(self, config: pytest.Config) -> None:
+        assert config.cache is not None
+        self._config = config
+        self._only_failed: bool = config.getoption("subtests_lf")
+        self._failed_first: bool = config.getoption("subtests_ff")
+        self._last_failed: dict[str, list[str]] = config.cache.get(
+            LASTFAILED_CACHE_KEY, {}
+        )
+        self._failed = {
+            nodeid: set(descriptions)
+            for nodeid, descriptions in self._last_failed.items()
+        }
+        # The failed subtests of the test being run, and those which do not exist anymore.
+        self._current: LastFailedSubTests | None = None
+        self._stale: dict[str, set[str]] = {}
+        # The tests with a failed subtest in this session.
+        self._failing: set[str] = set()
+
+    def last_failed(self, nodeid: str) -> LastFailedSubTests | None:
+        descriptions = self._last_failed.get(nodeid)
+        if not descriptions or not (self._only_failed or self._failed_first):
+            return None
+        self._current = LastFailedSubTests(
+            frozenset(descriptions), self._only_failed, self._failed_first
+        )
+        return self._current
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(
+        self, item: pytest.Item, call: CallInfo[None]
+    ) -> Generator[None, pluggy.Result[TestReport], None]:
+        outcome = yield
+        if call.when != "teardown":
+            return
+        current, self._current = self._current, None
+        if current is not None and not current.found:
+            # None of the subtests which failed exists anymore (or they were renamed): they are
+            # forgotten, so that the test runs all its subtests the next time.
+            report = outcome.get_result()
+            report.subtests_lf_stale = sorted(  # type: ignore[attr-defined]
+                current.descriptions
+            )
+
+    def pytest_runtest_logreport(self, report: pytest.TestReport) -> None:
+        # A plain attribute of the teardown report, so it is kept by pytest-xdist.
+        stale = getattr(report, "subtests_lf_stale", None)
+        if stale:
+            self._stale.setdefault(report.nodeid, set()).update(stale)
+        if not isinstance(report, SubTestReport):
+            if (
+                report.when == "call"
+                and report.passed
+                and report.nodeid not in self._failing
+            ):
+                # None of its subtests failed, including those only counted as passing, without
+                # their description (--subtests-aggregate, subtests.check_all()).
+                self._failed.pop(report.nodeid, None)
+            return
+        if hasattr(report, "subtests_aggregated"):
+            return
+        current = self._current
+        if (
+            current is not None
+            and report.sub_test_description() in current.descriptions
+        ):
+            # Reported without being asked whether to skip it (subtests.check_all()).
+            current.found = True
+        if report.failed:
+            self._failing.add(report.nodeid)
+            self._failed.setdefault(report.nodeid, set()).add(
+                report.sub_test_description()
+            )
+        elif report.nodeid in self._failed:
+            self._failed[report.nodeid].discard(report.sub_test_description())
+
+    def pytest_sessionfinish(self) -> None:
+        # The pytest-xdist controller gets the reports of all workers, so it writes the cache.
+        if hasattr(self._config, "workerinput"):
+            return
+        assert self._config.cache is not None
+        failed = {
+            nodeid: sorted(descriptions.difference(self._stale.get(nodeid, ())))
+            for nodeid, descriptions in self._failed.items()
+        }
+        failed = {
+            nodeid: descriptions
+            for nodeid, descriptions in failed.items()
+            if descriptions
+        }
+        if failed != self._last_failed:
+            self._config.cache.set(LASTFAILED_CACHE_KEY, failed)
+
+
+class SubTestsDurations:
+    """Shows the slowest subtests in the terminal summary (``--subtests-durations``)."""
+
+    def __init__(self, config: pytest.Config) -> None:
+        self._count: int = config.getoption("subtests_durations")
+        self._min_duration: float = config.getoption("subtests_durations_min")
+        # Only the slowest subtests are kept, in a heap of (duration, order, nodeid, description).
+        self._slowest: list[tuple[float, int, str, str]] = []
+        self._order = itertools.count()
+        self._hidden = 0
+
+    def pytest_runtest_logreport(self, report: pytest.TestReport) -> None:
+        if not isinstance(report, SubTestReport) or hasattr(
+            report, "subtests_aggregated"
+        ):
+            return
+        if report.duration < self._min_duration:
+            self._hidden += 1
+            return
+        if self._count and len(self._slowest) == self._count:
+            if report.duration <= self._slowest[0][0]:
+                return
+            heapq.heappop(self._slowest)
+        # The order is negated so that the first of equally slow subtests is shown first.
+        heapq.heappush(
+            self._slowest,
+            (
+                report.duration,
+                -next(self._order),
+                report.nodeid,
+                report.sub_test_description(),
+            ),
+        )
+
+    def pytest_terminal_summary(self, terminalreporter: TerminalReporter) -> None:
+        if self._count:
+            terminalreporter.write_sep("=", f"slowest {self._count} subtest durations")
+        else:
+            terminalreporter.write_sep("=", "slowest subtest durations")
+        for duration, _, nodeid, description in sorted(self._slowest, reverse=True):
+            terminalreporter.write_line(f"{duration:02.2f}s {nodeid} {description}")
+        if self._hidden:
+            terminalreporter.write_line(
+                f"({self._hidden} durations < {self._min_duration:g}s hidden.  "
+                "Use --subtests-durations-min=0 to show these durations.)"
+            )
+
+
+class SubTestsMemoryStats:
+    """
+    Shows the subtests with the highest peak of traced memory in the terminal summary
+    (``--subtests-memory``).
+    """
+
+    def __init__(self, config: pytest.Config) -> None:
+        self._count: int = config.getoption("subtests_memory_top")
+        # Heap of (peak, order, nodeid, description, memory usage data).
+        self._highest: list[tuple[int, int, str, str, dict[str, Any]]] = []
+        self._order = itertools.count()
+
+    def pytest_runtest_logreport(self, report: pytest.TestReport) -> None:
+        memory = getattr(report, "subtests_memory", None)
+        if memory is None or not isinstance(report, SubTestReport):
+            return
+        if self._count and len(self._highest) == self._count:
+            if memory["peak"] <= self._highest[0][0]:
+                return
+            heapq.heappop(self._highest)
+        heapq.heappush(
+            self._highest,
+            (
+                memory["peak"],
+                -next(self._order),
+                report.nodeid,
+                report.sub_test_description(),
+                memory,
+            ),
+        )
+
+    def pytest_terminal_summary(self, terminalreporter: TerminalReporter) -> None:
+        if not self._highest:
+            return
+        if self._count:
+            terminalreporter.write_sep("=", f"top {self._count} subtest memory peaks")
+        else:
+            terminalreporter.write_sep("=", "subtest memory peaks")
+        for peak, _, nodeid, description, memory in sorted(self._highest, reverse=True):
+            line = f"{format_size(peak)} peak, {format_size(memory['delta'], sign=True)} net"
+            if memory["rss_delta"] is not None:
+                line += f", {format_size(memory['rss_delta'], sign=True)} RSS"
+            terminalreporter.write_line(f"{line} {nodeid} {description}")
+
+
+class SubTestsProgress:
+    """
+    Shows a counter of the subtests of the running test in place of their letters
+    (``--subtests-progress=counter``), updated at most every ``interval`` seconds.
+
+    The counter is written after the cursor, which is then moved back to its start, so the
+    terminal reporter goes on writing at the same place, over the counter.
+    """
+
+    interval = 0.1
+
+    def __init__(self, config: pytest.Config) -> None:
+        self._config = config
+        self._tw: TerminalWriter | None = None
+        self._counts: dict[str, dict[str, int]] = {}
+        self._starts: dict[str, float] = {}
+        self._last_update = 0.0
+        self._shown = False
+
+    def pytest_sessionstart(self) -> None:
+        terminalreporter = self._config.pluginmanager.get_plugin("terminalreporter")
+        # Moving the cursor back needs a terminal supporting escape sequences.
+        if terminalreporter is not None and terminalreporter._tw.hasmarkup:
+            self._tw = terminalreporter._tw
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_logreport(self, report: pytest.TestReport) -> None:
+        if self._tw is None:
+            return
+        if not isinstance(report, SubTestReport):
+            # Erased before the terminal reporter writes the letter of the test.
+            self._show("")
+            if report.when == "teardown":
+                self._counts.pop(report.nodeid, None)
+                self._starts.pop(report.nodeid, None)
+            return
+
+        counts = self._counts.setdefault(
+            report.nodeid, dict.fromkeys(("passed", "failed", "skipped"), 0)
+        )
+        counts[report.outcome] += getattr(report, "subtests_aggregated", 1)
+        now = time.perf_counter()
+        start = self._starts.setdefault(report.nodeid, now)
+        if now - self._last_update < self.interval:
+            return
+        self._last_update = now
+        total = sum(counts.values())
+        rate = f", {total / (now - start):.0f} subtests/s" if now > start else ""
+        _, _, domain = report.location
+        self._show(
+            f" {domain}: {counts['passed']} passed, {counts['failed']} failed, "
+            f"{counts['skipped']} skipped{rate}"
+        )
+
+    def _show(self, text: str) -> None:
+        assert self._tw is not None
+        if not text and not self._shown:
+            return
+        # Not wrapped to the next line, as the cursor could not be moved back there.
+        text = text[: max(self._tw.fullwidth - self._tw.width_of_current_line - 1, 0)]
+        # Written to the file of the terminal writer, which would count it in the current line.
+        file = self._tw._file
+        file.write(f"\x1b[K{text}\x1b[{len(text)}D" if text else "\x1b[K")
+        file.flush()
+        self._shown = bool(text)
+
+
+class SubTestsJUnitXML:
+    """
+    Writes a JUnit XML report with a testcase for each subtest (``--subtests-junitxml``).
+
+    The testcases are written to ``PATH.part`` as the subtests are reported, only their counts
+    being kept in memory; the report is assembled when the session finishes, by copying them
+    between the ``<testsuite>`` element, which needs the counts, and its end.
+    """
+
+    def __init__(self, config: pytest.Config, path: str) -> None:
+        self._config = config
+        self._path = Path(config.invocation_params.dir, path)
+        self._part_path = self._path.with_name(f"{self._path.name}.part")
+        self._part: IO[str] | None = None
+        self._counts = dict.fromkeys(("tests", "failures", "skipped"), 0)
+        self._suite_start = time.time()
+
+    def pytest_sessionstart(self) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._part = open(self._part_path, "w", encoding="utf-8")
+        self._suite_start = time.time()
+
+    def pytest_runtest_logreport(self, report: pytest.TestReport) -> None:
+        if not isinstance(report, SubTestReport) or self._part is None:
+            return
+        *class_names, name = mangle_test_address(report.nodeid)
+        testcase = ElementTree.Element(
+            "testcase",
+            classname=".".join(class_names),
+            name=bin_xml_escape(f"{name} {report.sub_test_description()}"),
+            time=f"{report.duration:.3f}",
+        )
+        # An aggregated report stands for all the passing subtests it counts.
+        self._counts["tests"] += getattr(report, "subtests_aggregated", 1)
+        if report.failed:
+            self._counts["failures"] += 1
+            reprcrash = getattr(report.longrepr, "reprcrash", None)
+            failure = ElementTree.SubElement(
+                testcase,
+                "failure",
+                message=bin_xml_escape(
+                    reprcrash.message if reprcrash is not None else "failed"
+                ),
+            )
+            failure.text = bin_xml_escape(report.longreprtext)
+        elif report.skipped:
+            self._counts["skipped"] += 1
+            if hasattr(report, "wasxfail"):
+                skipped = ElementTree.SubElement(
+                    testcase,
+                    "skipped",
+                    type="pytest.xfail",
+                    message=bin_xml_escape(report.wasxfail),
+                )
+            else:
+                assert isinstance(report.longrepr, tuple)
+                filename, lineno, reason = report.longrepr
+                if reason.startswith("Skipped: "):
+                    reason = reason[9:]
+                skipped = ElementTree.SubElement(
+                    testcase,
+                    "skipped",
+                    type="pytest.skip",
+                    message=bin_xml_escape(reason),
+                )
+                skipped.text = bin_xml_escape(f"{filename}:{lineno}: {reason}")
+        for tag, content in (
+            ("system-out", report.capstdout),
+            ("system-err", report.capstderr),
+        ):
+            if content:
+                ElementTree.SubElement(testcase, tag).text = bin_xml_escape(content)
+        self._part.write(ElementTree.tostring(testcase, encoding="unicode"))
+
+    def pytest_sessionfinish(self) -> None:
+        if self._part is None:
+            return
+        self._part.close()
+        self._part = None
+        suite = ElementTree.Element(
+            "testsuite",
+            {
+                "name": "pytest",
+                "errors": "0",
+                **{key: str(count) for key, count in self._counts.items()},
+                "time": f"{time.time() - self._suite_start:.3f}",
+                "timestamp": datetime.fromtimestamp(self._suite_start)
+                .astimezone()
+                .isoformat(),
+                "hostname": platform.node(),
+            },
+        )
+        # The start tag of the element, without its end tag as it has no content yet.
+        start_tag = ElementTree.tostring(suite, encoding="unicode")[: -len(" />")]
+        with open(self._path, "w", encoding="utf-8") as f:
+            f.write(f'<?xml version="1.0" encoding="utf-8"?><testsuites>{start_tag}>')
+            with open(self._part_path, encoding="utf-8") as part:
+                shutil.copyfileobj(part, f)
+            f.write("</testsuite></testsuites>")
+        self._part_path.unlink()
+
+    def pytest_terminal_summary(self, terminalreporter: TerminalReporter) -> None:
+        terminalreporter.write_sep("-", f"generated subtests xml file: {self._path}")
+
+
+@attr.s(frozen=True)
+class ProcessCall:
+    """What a worker process needs to run a subtest of ``SubTests.map(executor="process")``."""
+
+    nodeid: str = attr.ib()
+    location: tuple[str, int | None, str] = attr.ib()
+    keywords: dict[str, int] = attr.ib()
+    msg: str | None = attr.ib()
+    capture: str = attr.ib()
+    tbstyle: Literal["auto", "long", "short", "line", "no", "native"] = attr.ib()
+    showlocals: bool = attr.ib()
+    log_level: int | None = attr.ib()
+    log_format: str | None = attr.ib()
+    log_date_format: str | None = attr.ib()
+    timeout: float | None = attr.ib()
+
+    @classmethod
+    def from_item(
+        cls, item: pytest.Item, msg: str | None, timeout: float | None
+    ) -> ProcessCall:
+        config = item.config
+        capman = config.pluginmanager.getplugin("capturemanager")
+        if capman is None or getattr(capman, "_capture_fixture", None):
+            capture = "no"
+        else:
+            capture = config.getoption("capture", "no")
+        logging_plugin = config.pluginmanager.getplugin("logging-plugin")
+        return cls(
+            nodeid=item.nodeid,
+            location=item.location,
+            keywords={x: 1 for x in item.keywords},
+            msg=msg,
+            capture=capture,
+            tbstyle=config.getoption("tbstyle", "auto"),
+            showlocals=config.getoption("showlocals", False),
+            log_level=logging_plugin.log_level if logging_plugin is not None else None,
+            log_format=(
+                get_option_ini(config, "log_format") if logging_plugin else None
+            ),
+            log_date_format=(
+                get_option_ini(config, "log_date_format") if logging_plugin else None
+            ),
+            timeout=timeout,
+        )
+
+
+def rewritten_module(fn: Callable[[Any], Any]) -> tuple[str, str] | None:
+    """
+    Return the name and path of the module defining ``fn`` if pytest rewrote its assertions
+    (test modules, conftest files), else ``None``.
+    """
+    module = sys.modules.get(getattr(fn, "__module__", None) or "")
+    if module is None or module.__file__ is None:
+        return None
+    if not isinstance(getattr(module, "__loader__", None), AssertionRewritingHook):
+        return None
+    return module.__name__, module.__file__
+
+
+def import_rewritten_module(module: tuple[str, str] | None) -> None:
+    """
+    Import the module returned by ``rewritten_module()`` with its assertions rewritten when a
+    worker process of ``SubTests.map(executor="process")`` starts, before the functions to call
+    are unpickled, so their failed assertions are explained as in the test process.
+
+    The module is executed again in each worker, which starts from a fresh interpreter: its
+    module-level side effects happen once per worker.
+    """
+    if module is None:
+        return
+    name, path = module
+    spec = importlib.util.spec_from_file_location(name, path)
+    assert spec is not None
+    rewritten = importlib.util.module_from_spec(spec)
+    source = Path(path).read_bytes()
+    tree = ast.parse(source, filename=path)
+    rewrite_asserts(tree, source, path)
+    sys.modules[name] = rewritten
+    exec(compile(tree, path, "exec", dont_inherit=True), rewritten.__dict__)
+
+
+def run_process_call(
+    process_call: ProcessCall, fn: Callable[[Any], Any], item: Any
+) -> tuple[Any, dict[str, Any]]:
+    """
+    Run ``fn(item)`` in a worker process of ``SubTests.map(executor="process")``.
+
+    Returns the result of the call and the serialized report of the subtest, as the traceback of a
+    failure cannot be sent back to the test process.
+    """
+    if process_call.capture == "fd":
+        capture: MultiCapture[str] | None = MultiCapture(
+            in_=None, out=FDCapture(1), err=FDCapture(2)
+        )
+    elif process_call.capture == "sys":
+        capture = MultiCapture(in_=None, out=SysCapture(1), err=SysCapture(2))
+    else:
+        capture = None
+
+    handler: LogCaptureHandler | None = None
+    if process_call.log_format is not None:
+        handler = LogCaptureHandler()
+        handler.setFormatter(
+            logging.Formatter(process_call.log_format, process_call.log_date_format)
+        )
+
+    result = None
+    excinfo = None
+    captured = Captured()
+    with ExitStack() as stack:
+        if handler is not None:
+            stack.enter_context(catching_logs(handler, level=process_call.log_level))
+        if capture is not None:
+            capture.start_capturing()
+        start = time.time()
+        precise_start = time.perf_counter()
+        try:
+            # Calls run in the main thread of worker processes, so they can be interrupted.
+            with alarm(process_call.timeout) if process_call.timeout else nullcontext():
+                result = fn(item)
+        except (Exit, KeyboardInterrupt):
+            raise
+        except BaseException:
+            excinfo = ExceptionInfo.from_current()
+            # Hide this frame from the traceback.
+            excinfo.traceback = excinfo.traceback[1:]
+        duration = time.perf_counter() - precise_start
+        stop = time.time()
+        if capture is not None:
+            captured.out, captured.err = capture.readouterr()
+            capture.stop_capturing()
+
+    outcome: Literal["passed", "failed", "skipped"]
+    longrepr: Any
+    extra: dict[str, Any] = {}
+    if excinfo is None:
+        outcome = "passed"
+        longrepr = None
+    elif isinstance(excinfo.value, pytest.xfail.Exception):
+        outcome = "skipped"
+        longrepr = None
+        extra["wasxfail"] = excinfo.value.msg
+    elif isinstance(excinfo.value, pytest.skip.Exception):
+        outcome = "skipped"
+        crash = excinfo._getreprcrash()
+        assert crash is not None
+        longrepr = (crash.path, crash.lineno, crash.message)
+    else:
+        outcome = "failed"
+        longrepr = excinfo.getrepr(
+            style="long" if process_call.tbstyle == "auto" else process_call.tbstyle,
+            showlocals=process_call.showlocals,
+        )
+
+    report = SubTestReport._from_test_report(
+        TestReport(
+            nodeid=process_call.nodeid,
+            location=process_call.location,
+            keywords=process_call.keywords,
+            outcome=outcome,
+            longrepr=longrepr,
+            when="call",
+            duration=duration,
+            start=start,
+            stop=stop,
+            **extra,
+        )
+    )
+    report.context = SubTestContext(process_call.msg, {"item": item})
+    captured.update_report(report)
+    if handler is not None:
+        CapturedLogs(handler.stream.getvalue()).update_report(report)
+    return result, report._to_json()
+
+
+def compact_id(value: Any) -> Any:
+    """
+    Return ``value`` if it is a number or a short string, else a string of at most
+    ``_COMPACT_ID_SIZE`` characters representing it.
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    elif isinstance(value, str):
+        if len(value) <= _COMPACT_ID_SIZE:
+            return value
+        return value[: _COMPACT_ID_SIZE - 3] + "..."
+    return saferepr(value, maxsize=_COMPACT_ID_SIZE)
+
+
+def compare_all(
+    actual: Any, expected: Any, ids: Any, rtol: float, atol: float
+) -> tuple[int, Iterator[tuple[dict[str, Any], str]]]:
+    """
+    Compare ``actual`` to ``expected`` element by element (``SubTests.check_all()``), returning the
+    number of matching elements and the parameters and message of each mismatch.
+    """
+    # NumPy arrays can only be given if numpy was imported already.
+    numpy = sys.modules.get("numpy")
+    if numpy is not None and (
+        isinstance(actual, numpy.ndarray) or isinstance(expected, numpy.ndarray)
+    ):
+        return compare_arrays(numpy, actual, expected, ids, rtol, atol)
+
+    actual = list(actual)
+    if isinstance(expected, Collection) and not isinstance(expected, (str, bytes)):
+        expected = list(expected)
+        if len(expected) != len(actual):
+            raise ValueError(
+                f"actual and expected have different lengths: {len(actual)} != {len(expected)}"
+            )
+    else:
+        expected = [expected] * len(actual)
+
+    if rtol or atol:
+        matches = [
+            math.isclose(a, e, rel_tol=rtol, abs_tol=atol)
+            for a, e in zip(actual, expected)
+        ]
+    else:
+        matches = [a == e for a, e in zip(actual, expected)]
+    mismatches = [index for index, match in enumerate(matches) if not match]
+    failures = (
+        (
+            {"index": index} if ids is None else {"id": compact_id(ids[index])},
+            mismatch_message(actual[index], expected[index], rtol, atol),
+        )
+        for index in mismatches
+    )
+    return len(actual) - len(mismatches), failures
+
+
+def compare_arrays(
+    numpy: Any, actual: Any, expected: Any, ids: Any, rtol: float, atol: float
+) -> tuple[int, Iterator[tuple[dict[str, Any], str]]]:
+    actual = numpy.asarray(actual)
+    expected = numpy.asarray(expected)
+    shape = numpy.broadcast_shapes(actual.shape, expected.shape)
+    actual = numpy.broadcast_to(actual, shape)
+    expected = numpy.broadcast_to(expected, shape)
+    if rtol or atol:
+        matches = numpy.isclose(actual, expected, rtol=rtol, atol=atol)
+    else:
+        matches = numpy.asarray(actual == expected)
+    mismatches = numpy.argwhere(~matches)
+    if ids is not None:
+        ids = numpy.asarray(ids)
+
+    def failures() -> Iterator[tuple[dict[str, Any], str]]:
+        for row in mismatches:
+            position = tuple(row.tolist())
+            params: dict[str, Any]
+            if ids is None:
+                params = {"index": position[0] if len(position) == 1 else position}
+            else:
+                params = {"id": compact_id(ids[position].item())}
+            yield (
+                params,
+                mismatch_message(
+                    actual[position].item(), expected[position].item(), rtol, atol
+                ),
+            )
+
+    return matches.size - len(mismatches), failures()
+
+
+def check_failure(message: str) -> ExceptionInfo[BaseException]:
+    """
+    Return the failure of a check made outside of the body of the subtest (in bulk, or of its memory
+    budget), shown without traceback.
+    """
+    # Raised outside of the hidden frames: only the message is shown, but it needs a visible frame.
+    try:
+        pytest.fail(message, pytrace=False)
+    except pytest.fail.Exception:
+        return ExceptionInfo.from_current()
+
+
+def mismatch_message(actual: Any, expected: Any, rtol: float, atol: float) -> str:
+    if rtol or atol:
+        return (
+            f"{saferepr(actual)} is not close to {saferepr(expected)} "
+            f"(rtol={rtol:g}, atol={atol:g})"
+        )
+    return f"{saferepr(actual)} != {saferepr(expected)}"
+
 
 def make_call_info(
     exc_info: ExceptionInfo[BaseException] | None,
@@ -359,23 +2353,284 @@ def make_call_info(
     )
 
 
+async def call_awaitable(
+    aw: Awaitable[Any],
+    semaphore: asyncio.Semaphore | None,
+    timeout: float | None = None,
+) -> tuple[Any, CallInfo]:
+    """
+    Await ``aw``, once ``semaphore`` is acquired if given, and return its result along with
+    the ``CallInfo`` of the call, as ``CallInfo.from_call()`` does for regular calls.
+
+    The call fails if ``aw`` does not finish within ``timeout`` seconds.
+    """
+    __tracebackhide__ = True
+    import asyncio
+
+    if semaphore is not None:
+        async with semaphore:
+            return await call_awaitable(aw, None, timeout)
+
+    start = time.time()
+    precise_start = time.perf_counter()
+    result = None
+    exc_info: ExceptionInfo[BaseException] | None = None
+    try:
+        if timeout is None:
+            result = await aw
+        else:
+            result = await await_with_timeout(aw, timeout)
+    except (Exit, KeyboardInterrupt, asyncio.CancelledError):
+        raise
+    except BaseException:
+        exc_info = ExceptionInfo.from_current()
+    duration = time.perf_counter() - precise_start
+    call_info = make_call_info(
+        exc_info, start=start, stop=time.time(), duration=duration, when="call"
+    )
+    return result, call_info
+
+
+async def await_with_timeout(aw: Awaitable[Any], timeout: float) -> Any:
+    """
+    Await ``aw``, failing with the stack where it is suspended if it does not finish within
+    ``timeout`` seconds, after cancelling it.
+    """
+    __tracebackhide__ = True
+    import asyncio
+
+    task = asyncio.ensure_future(aw)
+    try:
+        done, _ = await asyncio.wait({task}, timeout=timeout)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    if not done:
+        stack = format_stack(coroutine_frames(task.get_coro()))
+        task.cancel()
+        await asyncio.wait({task})
+        timeout_failure(timeout, stack)
+    return task.result()
+
+
+def coroutine_frames(coro: Any) -> list[FrameType]:
+    """Return the frames of a suspended coroutine and of the coroutines it is awaiting."""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+
+class DaemonThreadPool:
+    """
+    The thread pool of ``SubTests.map()``.
+
+    Unlike the threads of ``ThreadPoolExecutor``, which are joined when the interpreter exits, its
+    threads are daemon threads, so that a call left running after a timeout does not keep the
+    process alive.
+    """
+
+    def __init__(self, max_workers: int | None = None) -> None:
+        if max_workers is None:
+            # The default of ThreadPoolExecutor.
+            max_workers = min(32, (os.cpu_count() or 1) + 4)
+        if max_workers <= 0:
+            raise ValueError("max_workers must be greater than 0")
+        self._max_workers = max_workers
+        self._queue: queue.SimpleQueue[tuple[Future[CallInfo], ThreadCall] | None] = (
+            queue.SimpleQueue()
+        )
+        self._threads: list[threading.Thread] = []
+
+    def submit(self, call: ThreadCall) -> Future[CallInfo]:
+        future: Future[CallInfo] = Future()
+        self._queue.put((future, call))
+        if len(self._threads) < self._max_workers:
+            thread = threading.Thread(
+                target=self._work,
+                name=f"subtests-map-{len(self._threads)}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+        return future
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        if cancel_futures:
+            while True:
+                try:
+                    work = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if work is not None:
+                    work[0].cancel()
+        for _ in self._threads:
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _work(self) -> None:
+        while True:
+            work = self._queue.get()
+            if work is None:
+                return
+            future, call = work
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(call())
+            except BaseException as exc:
+                future.set_exception(exc)
+
+
+class ThreadCall:
+    """A call of ``SubTests.map()`` run on a thread pool, which can be waited for with a timeout."""
+
+    def __init__(self, fn: Callable[[], Any]) -> None:
+        self._fn = fn
+        self._thread_id: int | None = None
+        self._precise_start: float | None = None
+
+    def __call__(self) -> CallInfo:
+        __tracebackhide__ = True
+        self._thread_id = threading.get_ident()
+        self._precise_start = time.perf_counter()
+        return CallInfo.from_call(
+            self._fn, when="call", reraise=(Exit, KeyboardInterrupt)
+        )
+
+    def wait(self, future: Future[CallInfo], timeout: float | None) -> CallInfo:
+        """
+        Return the ``CallInfo`` of the call, or a failure with the stack of its thread if it runs
+        for more than ``timeout`` seconds, in which case it is left running.
+        """
+        if timeout is None:
+            return future.result()
+        while not future.done():
+            if self._precise_start is None:
+                # Not started yet, waiting for a thread of the pool.
+                wait_futures([future], timeout=timeout)
+                continue
+            remaining = self._precise_start + timeout - time.perf_counter()
+            if remaining <= 0:
+                return self._timeout_failure(timeout, self._precise_start)
+            wait_futures([future], timeout=remaining)
+        return future.result()
+
+    def _timeout_failure(self, timeout: float, precise_start: float) -> CallInfo:
+        duration = time.perf_counter() - precise_start
+        assert self._thread_id is not None
+        frame = sys._current_frames().get(self._thread_id)
+        frames = []
+        # Only keeps the frames of the call, not the ones of the thread pool.
+        while frame is not None and frame.f_code is not CallInfo.from_call.__code__:
+            frames.append(frame)
+            frame = frame.f_back
+        try:
+            timeout_failure(timeout, format_stack(reversed(frames)))
+        except pytest.fail.Exception:
+            exc_info = ExceptionInfo.from_current()
+        stop = time.time()
+        return make_call_info(
+            exc_info, start=stop - duration, stop=stop, duration=duration, when="call"
+        )
+
+
 @contextmanager
-def capturing_output(request: SubRequest) -> Iterator[Captured]:
-    option = request.config.getoption("capture", None)
+def alarm(timeout: float) -> Iterator[None]:
+    """
+    Interrupt the block with a failure if it runs for more than ``timeout`` seconds, using
+    ``SIGALRM``; does nothing where it is not available, or outside of the main thread.
+    """
+    if (
+        not hasattr(signal, "setitimer")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        yield
+        return
+
+    def handler(signum: int, frame: FrameType | None) -> None:
+        __tracebackhide__ = True
+        if enclosing_first and callable(previous_handler):
+            previous_handler(signum, frame)
+        else:
+            timeout_failure(timeout)
+
+    precise_start = time.perf_counter()
+    previous_delay, previous_interval = signal.getitimer(signal.ITIMER_REAL)
+    # The timer of an enclosing subtest (or another plugin) may expire first.
+    enclosing_first = 0 < previous_delay < timeout
+    previous_handler = signal.getsignal(signal.SIGALRM)
+    signal.signal(signal.SIGALRM, handler)
+    signal.setitimer(signal.ITIMER_REAL, previous_delay if enclosing_first else timeout)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+        if previous_delay:
+            remaining = previous_delay - (time.perf_counter() - precise_start)
+            # Expires right away if it should have already, as it was replaced by ours.
+            signal.setitimer(
+                signal.ITIMER_REAL, max(remaining, 1e-6), previous_interval
+            )
+
+
+def timeout_failure(timeout: float, stack: str | None = None) -> NoReturn:
+    """
+    Fail a subtest which ran for more than ``timeout`` seconds, with the ``stack`` where it was
+    stuck when it did not run in the current thread, else with the traceback.
+    """
+    # Only the message of a failure without traceback is shown, but it needs a visible frame.
+    __tracebackhide__ = stack is None
+    message = f"Timeout: subtest ran for more than {timeout:g}s"
+    if stack is None:
+        pytest.fail(message)
+    pytest.fail(f"{message}, stack when it timed out:\n{stack}", pytrace=False)
+
+
+def format_stack(frames: Iterable[FrameType]) -> str:
+    return "".join(
+        traceback.StackSummary.extract(
+            (frame, frame.f_lineno) for frame in frames
+        ).format()
+    )
+
+
+def make_capture_fixture(request: pytest.FixtureRequest) -> CaptureFixture | None:
+    """
+    Create the capture fixture used to capture the output of subtests, according to the
+    ``--subtests-capture`` option, else the ``--capture`` option, or ``None`` if the output
+    should not be captured.
+    """
+    option = request.config.getoption("subtests_capture", "inherit")
+    if option in ("inherit", "no"):
+        # "no" when captured anyway with subtests.test(capture=True).
+        option = request.config.getoption("capture", None)
 
     # capsys or capfd are active, subtest should not capture.
     capman = request.config.pluginmanager.getplugin("capturemanager")
     capture_fixture_active = getattr(capman, "_capture_fixture", None)
 
+    # The request is only kept by the capture fixture, the request of a unittest item will do.
     if option == "sys" and not capture_fixture_active:
         with ignore_pytest_private_warning():
-            fixture = CaptureFixture(SysCapture, request)
+            return CaptureFixture(SysCapture, request)  # type: ignore[arg-type]
     elif option == "fd" and not capture_fixture_active:
         with ignore_pytest_private_warning():
-            fixture = CaptureFixture(FDCapture, request)
+            return CaptureFixture(FDCapture, request)  # type: ignore[arg-type]
     else:
-        fixture = None
+        return None
+
 
+@contextmanager
+def capturing_output(request: pytest.FixtureRequest) -> Iterator[Captured]:
+    fixture = make_capture_fixture(request)
     if fixture is not None:
         fixture._start()
 
@@ -390,20 +2645,275 @@ def capturing_output(request: SubRequest) -> Iterator[Captured]:
             captured.err = err
 
 
-@contextmanager
-def capturing_logs(
-    request: SubRequest,
-) -> Iterator[CapturedLogs | NullCapturedLogs]:
-    logging_plugin = request.config.pluginmanager.getplugin("logging-plugin")
-    if logging_plugin is None:
-        yield NullCapturedLogs()
-    else:
-        handler = LogCaptureHandler()
-        handler.setFormatter(logging_plugin.formatter)
+class SharedOutputCapture:
+    """
+    Output capture shared by all the subtests of a test (``--subtests-shared-capture``).
+
+    The capture is started by the first subtest and suspended between subtests, so the output written
+    by the test outside of subtests still goes to the test's own capture. Each subtest reads only the
+    output written since it was entered, which avoids duplicating file descriptors and creating
+    temporary files for every subtest.
+    """
+
+    def __init__(self, request: pytest.FixtureRequest) -> None:
+        self._request = request
+        self._fixture: CaptureFixture | None = None
+        # Captured objects of the subtests currently executing, innermost last.
+        self._active: list[Captured] = []
+
+    @contextmanager
+    def capturing(self) -> Iterator[Captured]:
+        captured = Captured()
+        fixture = self._fixture
+        if not self._active:
+            if fixture is None:
+                fixture = make_capture_fixture(self._request)
+                if fixture is None:
+                    yield captured
+                    return
+                self._fixture = fixture
+                fixture._start()
+            else:
+                fixture._resume()
+        else:
+            assert fixture is not None
+            # Output written so far belongs to the enclosing subtest.
+            out, err = fixture.readouterr()
+            self._active[-1].out += out
+            self._active[-1].err += err
+
+        self._active.append(captured)
+        try:
+            yield captured
+        finally:
+            out, err = fixture.readouterr()
+            captured.out += out
+            captured.err += err
+            self._active.pop()
+            if not self._active:
+                fixture._suspend()
+
+    @contextmanager
+    def suspended(self) -> Iterator[None]:
+        """
+        Suspend capturing for the enclosing subtest, if any, while a nested subtest is reported.
+
+        Reporting suspends and resumes the global capture, which would otherwise take over the
+        output of the enclosing subtest.
+        """
+        if self._active and self._fixture is not None:
+            self._fixture._suspend()
+            try:
+                yield
+            finally:
+                self._fixture._resume()
+        else:
+            yield
+
+    def close(self) -> None:
+        if self._fixture is not None:
+            self._fixture.close()
+            self._fixture = None
+
+
+class SharedLogCapture:
+    """
+    Log capture shared by all the subtests of a test.
+
+    A single handler is installed on the first subtest and removed when the test finishes. It is
+    disabled between subtests (through its level, so records logged outside subtests are not even
+    formatted), and each subtest gets the slice of the log text written since it was entered.
+    """
+
+    def __init__(self, formatter: logging.Formatter) -> None:
+        self._handler = LogCaptureHandler()
+        self._handler.setFormatter(formatter)
+        self._handler.setLevel(_DISABLED_LOG_LEVEL)
+        self._exit_stack = ExitStack()
+        self._installed = False
+        self._depth = 0
+
+    @contextmanager
+    def capturing(self) -> Iterator[CapturedLogs]:
+        handler = self._handler
+        if self._depth == 0:
+            if not self._installed:
+                self._exit_stack.enter_context(catching_logs(handler))
+                self._installed = True
+            handler.setLevel(logging.NOTSET)
+        self._depth += 1
+
+        captured = CapturedLogs()
+        start = handler.stream.tell()
+        try:
+            yield captured
+        finally:
+            captured.text = handler.stream.getvalue()[start:]
+            self._depth -= 1
+            if self._depth == 0:
+                handler.setLevel(_DISABLED_LOG_LEVEL)
+                handler.reset()
+
+    def close(self) -> None:
+        self._exit_stack.close()
+
+
+def profile_file_name(item: pytest.Item) -> str:
+    """Return the name of the file where the profile of the subtests of ``item`` is written."""
+    name = re.sub(r"[^\w.-]+", "_", item.nodeid).strip("_")
+    workerinput = getattr(item.config, "workerinput", None)
+    if workerinput is not None:
+        # The same test can run on several workers with --subtests-shard.
+        name += f"-{workerinput['workerid']}"
+    return f"{name}.prof"
+
+
+class SubTestsProfiler:
+    """
+    Profiles the subtests of a test (``--subtests-profile``), merging their profiles to write
+    them to ``path`` once the test finishes.
+
+    Only outermost subtests are profiled, as a profiler cannot be enabled twice.
+    """
+
+    def __init__(
+        self, path: Path, pattern: re.Pattern[str] | None, min_duration: float
+    ) -> None:
+        self._path = path
+        self._pattern = pattern
+        self._min_duration = min_duration
+        self._stats: pstats.Stats | None = None
+        self._profiling = False
+
+    @contextmanager
+    def profiling(
+        self, context: SubTestContext
+    ) -> Iterator[SubTestProfile | NullSubTestProfile]:
+        if self._profiling or (
+            self._pattern is not None
+            and not self._pattern.search(context.description())
+        ):
+            yield NullSubTestProfile()
+            return
+
+        import cProfile
+        import pstats
+
+        profile = cProfile.Profile()
+        self._profiling = True
+        profile.enable()
+        try:
+            yield SubTestProfile(profile, self._min_duration)
+        finally:
+            profile.disable()
+            self._profiling = False
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+
+    def dump(self) -> None:
+        if self._stats is not None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            self._stats.dump_stats(self._path)
+
+
+@attr.s
+class SubTestProfile:
+    profile: cProfile.Profile = attr.ib()
+    min_duration: float = attr.ib()
+
+    def update_report(self, report: pytest.TestReport) -> None:
+        if report.duration >= self.min_duration:
+            import pstats
+
+            stream = io.StringIO()
+            stats = pstats.Stats(self.profile, stream=stream)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(10)
+            report.sections.append(("Profile call", stream.getvalue().strip("\n")))
+
 
-        captured_logs = CapturedLogs(handler)
-        with catching_logs(handler):
-            yield captured_logs
+class NullSubTestProfile:
+    def update_report(self, report: pytest.TestReport) -> None:
+        pass
+
+
+def read_rss() -> int | None:
+    """Return the resident set size of the process in bytes, or ``None`` if unknown (non Linux)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * _PAGE_SIZE
+
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+class SubTestsMemoryTracer:
+    """
+    Traces the memory allocated by the subtests of a test with tracemalloc (``--subtests-memory``).
+
+    The peak of traced memory is reset when each subtest starts, so the peaks reached by enclosing
+    subtests until then are kept aside, to be restored when nested subtests exit.
+    """
+
+    def __init__(self, budget: int | None) -> None:
+        self._budget = budget
+        self._enclosing_peaks: list[int] = []
+
+    @contextmanager
+    def tracing(self) -> Iterator[MemoryUsage]:
+        start, peak = tracemalloc.get_traced_memory()
+        if self._enclosing_peaks:
+            self._enclosing_peaks[-1] = max(self._enclosing_peaks[-1], peak)
+        self._enclosing_peaks.append(0)
+        start_rss = read_rss()
+        tracemalloc.reset_peak()
+        usage = MemoryUsage(budget=self._budget)
+        try:
+            yield usage
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, self._enclosing_peaks.pop())
+            if self._enclosing_peaks:
+                self._enclosing_peaks[-1] = max(self._enclosing_peaks[-1], peak)
+            usage.peak = peak - start
+            usage.delta = current - start
+            stop_rss = read_rss()
+            if start_rss is not None and stop_rss is not None:
+                usage.rss_delta = stop_rss - start_rss
+
+
+@attr.s(auto_attribs=True)
+class MemoryUsage:
+    """Memory used by a subtest, in bytes (``--subtests-memory``)."""
+
+    budget: int | None = None
+    peak: int = 0
+    delta: int = 0
+    rss_delta: int | None = None
+
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.peak > self.budget
+
+    def budget_failure(self) -> ExceptionInfo[BaseException]:
+        return check_failure(
+            f"peak of traced memory {format_size(self.peak)} is above the budget "
+            f"of {format_size(self.budget or 0)}"
+        )
+
+    def update_report(self, report: pytest.TestReport) -> None:
+        # A plain attribute, so it is kept when the report is serialized by pytest-xdist.
+        report.subtests_memory = {  # type: ignore[attr-defined]
+            "peak": self.peak,
+            "delta": self.delta,
+            "rss_delta": self.rss_delta,
+        }
 
 
 @contextmanager
@@ -431,12 +2941,13 @@ class Captured:
             report.sections.append(("Captured stderr call", self.err))
 
 
+@attr.s
 class CapturedLogs:
-    def __init__(self, handler: LogCaptureHandler) -> None:
-        self._handler = handler
+    text = attr.ib(default="", type=str)
 
     def update_report(self, report: pytest.TestReport) -> None:
-        report.sections.append(("Captured log call", self._handler.stream.getvalue()))
+        if self.text:
+            report.sections.append(("Captured log call", self.text))
 
 
 class NullCapturedLogs:
@@ -444,6 +2955,80 @@ class NullCapturedLogs:
         pass
 
 
+class UnitTestSubTestCapture:
+    """
+    Output and log capture of the ``self.subTest()`` blocks of a unittest test, with the same
+    machinery as the ``subtests`` fixture. Closed once the test finishes.
+    """
+
+    def __init__(self, item: TestCaseFunction) -> None:
+        config = item.config
+        self._request = item._request
+        # Only timed with --subtests-capture=no.
+        self._capture = config.getoption("subtests_capture") != "no"
+        self._shared_capture: SharedOutputCapture | None = None
+        if self._capture and config.getoption("subtests_shared_capture"):
+            self._shared_capture = SharedOutputCapture(self._request)
+        self._log_capture: SharedLogCapture | None = None
+        logging_plugin = config.pluginmanager.getplugin("logging-plugin")
+        if self._capture and logging_plugin is not None:
+            self._log_capture = SharedLogCapture(logging_plugin.formatter)
+
+    @contextmanager
+    def capturing(self) -> Iterator[UnitTestSubTestCall]:
+        call = UnitTestSubTestCall(start=time.time())
+        precise_start = time.perf_counter()
+        with ExitStack() as exit_stack:
+            if self._shared_capture is not None:
+                call.captured_output = exit_stack.enter_context(
+                    self._shared_capture.capturing()
+                )
+            elif self._capture:
+                call.captured_output = exit_stack.enter_context(
+                    capturing_output(self._request)
+                )
+            if self._log_capture is not None:
+                call.captured_logs = exit_stack.enter_context(
+                    self._log_capture.capturing()
+                )
+            try:
+                yield call
+            finally:
+                exit_stack.close()
+                call.duration = time.perf_counter() - precise_start
+                call.stop = time.time()
+
+    def close(self) -> None:
+        if self._shared_capture is not None:
+            self._shared_capture.close()
+        if self._log_capture is not None:
+            self._log_capture.close()
+
+
+@attr.s(auto_attribs=True)
+class UnitTestSubTestCall:
+    """Timing, output and log records of a ``self.subTest()`` block."""
+
+    start: float
+    stop: float = 0
+    duration: float = 0
+    captured_output: Captured = attr.ib(factory=Captured)
+    captured_logs: CapturedLogs | NullCapturedLogs = attr.ib(factory=NullCapturedLogs)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item: pytest.Item) -> Generator[None, None, None]:
+    yield
+    capture = item.__dict__.pop("_subtests_unittest_capture", None)
+    if capture is not None:
+        capture.close()
+    # Subtests aggregated, or batched by pytest-xdist workers, are reported before the report of
+    # the test itself.
+    subtests = getattr(item, "funcargs", {}).get("subtests")
+    if isinstance(subtests, SubTests):
+        subtests._flush()
+
+
 def pytest_report_to_serializable(report: pytest.TestReport) -> dict[str, Any] | None:
     if isinstance(report, SubTestReport):
         return report._to_json()
@@ -458,15 +3043,21 @@ def pytest_report_from_serializable(data: dict[str, Any]) -> SubTestReport | Non
 
 @pytest.hookimpl(tryfirst=True)
 def pytest_report_teststatus(
-    report: pytest.TestReport,
+    report: pytest.TestReport | RetainedSubTestReport,
     config: pytest.Config,
 ) -> tuple[str, str, str | Mapping[str, bool]] | None:
-    if report.when != "call" or not isinstance(report, SubTestReport):
+    if report.when != "call" or not isinstance(
+        report, (SubTestReport, RetainedSubTestReport)
+    ):
         return None
 
     outcome = report.outcome
     description = report.sub_test_description()
     no_output = ("", "", "")
+    no_shortletter = (
+        config.option.no_subtests_shortletter
+        or config.getoption("subtests_progress", "letters") == "counter"
+    )
 
     if hasattr(report, "wasxfail"):
         if config.option.no_subtests_reports and outcome != "skipped":
@@ -484,19 +3075,19 @@ def pytest_report_teststatus(
             # the correct outcome. Pytest expects the call outcome to be either skipped or passed in case of xfail.
             # Let's pass this report to the next hook.
             return None
-        short = "" if config.option.no_subtests_shortletter else short
+        short = "" if no_shortletter else short
         return f"subtests {category}", short, f"{description} {status}"
 
     if config.option.no_subtests_reports and outcome != "failed":
         return no_output
     elif report.passed:
-        short = "" if config.option.no_subtests_shortletter else ","
+        short = "" if no_shortletter else ","
         return f"subtests {outcome}", short, f"{description} SUBPASS"
     elif report.skipped:
-        short = "" if config.option.no_subtests_shortletter else "-"
+        short = "" if no_shortletter else "-"
         return outcome, short, f"{description} SUBSKIP"
     elif outcome == "failed":
-        short = "" if config.option.no_subtests_shortletter else "u"
+        short = "" if no_shortletter else "u"
         return outcome, short, f"{description} SUBFAIL"
 
     return None
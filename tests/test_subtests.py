@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+import importlib.util
 import sys
 from pathlib import Path
 from typing import Literal
+from xml.etree import ElementTree
 
 import pytest
 
@@ -212,6 +214,995 @@ class TestFixture:
             ]
         )
 
+    def test_aggregate(
+        self,
+        simple_script: None,
+        pytester: pytest.Pytester,
+        mode: Literal["normal", "xdist"],
+    ) -> None:
+        if mode == "normal":
+            result = pytester.runpytest("-v", "--subtests-aggregate")
+            expected_lines = [
+                "*collected 1 item",
+                "test_aggregate.py::test_foo [[]custom[]] (i=1) SUBFAIL *100%*",
+                "test_aggregate.py::test_foo [[]custom[]] (i=3) SUBFAIL *100%*",
+                # Passing subtests are reported once the test function returns.
+                "test_aggregate.py::test_foo [[]3 passing subtests[]] SUBPASS *100%*",
+                "test_aggregate.py::test_foo PASSED *100%*",
+            ]
+        else:
+            assert mode == "xdist"
+            pytest.importorskip("xdist")
+            result = pytester.runpytest("-n1", "-v", "--subtests-aggregate")
+            expected_lines = [
+                "1 worker [1 item]",
+                "*gw0*100%* SUBFAIL test_aggregate.py::test_foo*",
+                "*gw0*100%* SUBPASS test_aggregate.py::test_foo*",
+                "*gw0*100%* PASSED test_aggregate.py::test_foo*",
+            ]
+        expected_lines += [
+            "* test_foo [[]custom[]] (i=1) *",
+            "* test_foo [[]custom[]] (i=3) *",
+            "* 2 failed, 1 passed, 3 subtests passed in *",
+        ]
+        result.stdout.fnmatch_lines(expected_lines)
+        result.stdout.no_fnmatch_line("*(i=0)*")
+
+    def test_xdist_batch(
+        self,
+        simple_script: None,
+        pytester: pytest.Pytester,
+        mode: Literal["normal", "xdist"],
+    ) -> None:
+        if mode == "normal":
+            # Reports are only batched by pytest-xdist workers.
+            result = pytester.runpytest("-v", "--subtests-xdist-batch=2")
+            expected_lines = [
+                "test_xdist_batch.py::test_foo [[]custom[]] (i=0) SUBPASS *100%*",
+                "test_xdist_batch.py::test_foo [[]custom[]] (i=1) SUBFAIL *100%*",
+                "test_xdist_batch.py::test_foo [[]custom[]] (i=2) SUBPASS *100%*",
+                "test_xdist_batch.py::test_foo [[]custom[]] (i=3) SUBFAIL *100%*",
+                "test_xdist_batch.py::test_foo [[]custom[]] (i=4) SUBPASS *100%*",
+                "test_xdist_batch.py::test_foo PASSED *100%*",
+            ]
+        else:
+            assert mode == "xdist"
+            pytest.importorskip("xdist")
+            result = pytester.runpytest("-n1", "-v", "--subtests-xdist-batch=2")
+            expected_lines = [
+                "1 worker [1 item]",
+                "*gw0*100%* SUBPASS test_xdist_batch.py::test_foo*",
+                "*gw0*100%* SUBFAIL test_xdist_batch.py::test_foo*",
+                "*gw0*100%* SUBPASS test_xdist_batch.py::test_foo*",
+                "*gw0*100%* SUBFAIL test_xdist_batch.py::test_foo*",
+                "*gw0*100%* SUBPASS test_xdist_batch.py::test_foo*",
+                "*gw0*100%* PASSED test_xdist_batch.py::test_foo*",
+            ]
+        expected_lines += [
+            "* test_foo [[]custom[]] (i=1) *",
+            "* test_foo [[]custom[]] (i=3) *",
+            "* 2 failed, 1 passed, 3 subtests passed in *",
+        ]
+        result.stdout.fnmatch_lines(expected_lines, consecutive=False)
+
+    def test_durations(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        pytester.makepyfile(
+            """
+            import time
+
+            def test_foo(subtests):
+                for i, duration in enumerate([0, 0.25, 0.5, 0.1]):
+                    with subtests.test("slow", i=i):
+                        time.sleep(duration)
+            """
+        )
+        # Far enough from the durations for the subtest without sleep to stay under it when busy.
+        args = ["--subtests-durations=2", "--subtests-durations-min=0.05"]
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        result = pytester.runpytest(*args)
+        result.stdout.fnmatch_lines(
+            [
+                "*= slowest 2 subtest durations =*",
+                "*s test_durations.py::test_foo [[]slow[]] (i=2)",
+                "*s test_durations.py::test_foo [[]slow[]] (i=1)",
+                "(1 durations < 0.05s hidden.  Use --subtests-durations-min=0 to show these durations.)",
+                "* 1 passed, 4 subtests passed in *",
+            ],
+            consecutive=True,
+        )
+
+    def test_profile(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        import pstats
+
+        pytester.makepyfile(
+            """
+            import time
+
+            def slow_function():
+                time.sleep(0.5)
+
+            def fast_function():
+                pass
+
+            def test_foo(subtests):
+                with subtests.test("slow"):
+                    slow_function()
+                    assert False
+                with subtests.test("fast"):
+                    fast_function()
+                    assert False
+                with subtests.test("filtered"):
+                    fast_function()
+            """
+        )
+        args = [
+            "--subtests-profile",
+            "--subtests-profile-filter=slow|fast",
+            # Far enough from both subtests for the fast one to stay under it when busy.
+            "--subtests-durations-min=0.1",
+        ]
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        result = pytester.runpytest(*args)
+        result.stdout.fnmatch_lines(
+            [
+                "*__ test_foo [[]slow[]] __*",
+                "*- Profile call -*",
+                "*cumulative*",
+                "*test_profile.py:*(slow_function)",
+                "*__ test_foo [[]fast[]] __*",
+                "*short test summary info*",
+            ]
+        )
+        # Only subtests taking at least --subtests-durations-min get a profile section.
+        assert result.stdout.str().count("Profile call") == 1
+
+        (path,) = (pytester.path / "prof").iterdir()
+        assert path.name.startswith("test_profile.py_test_foo")
+        stats = pstats.Stats(str(path)).stats  # type: ignore[attr-defined]
+        calls = {name: nc for (_, _, name), (_, nc, _, _, _) in stats.items()}
+        assert calls["slow_function"] == 1
+        # The "filtered" subtest is not profiled.
+        assert calls["fast_function"] == 1
+        # Only the body of the subtests is profiled.
+        assert "update_report" not in calls
+
+    def test_memory(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        pytester.makepyfile(
+            """
+            leaked = []
+
+            def test_foo(subtests):
+                for i in range(3):
+                    with subtests.test("alloc", i=i):
+                        if i == 1:
+                            data = bytearray(5 * 2**20)
+                            del data
+                        elif i == 2:
+                            leaked.append(bytearray(2 * 2**20))
+            """
+        )
+        args = ["--subtests-memory", "--subtests-memory-top=2"]
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        result = pytester.runpytest(*args)
+        result.stdout.fnmatch_lines(
+            [
+                "*= top 2 subtest memory peaks =*",
+                "5.0 MiB peak, ?0.0 MiB net* test_memory.py::test_foo [[]alloc[]] (i=1)",
+                "2.0 MiB peak, +2.0 MiB net* test_memory.py::test_foo [[]alloc[]] (i=2)",
+                "* 1 passed, 3 subtests passed in *",
+            ],
+            consecutive=True,
+        )
+
+    def test_memory_budget(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        pytester.makepyfile(
+            """
+            def test_foo(subtests):
+                for size in [1, 4]:
+                    with subtests.test(size=size):
+                        data = bytearray(size * 2**20)
+                        del data
+            """
+        )
+        args = ["--subtests-memory-budget=2M"]
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        result = pytester.runpytest(*args)
+        result.stdout.fnmatch_lines(
+            [
+                "*__ test_foo (size=4) __*",
+                "peak of traced memory 4.0 MiB is above the budget of 2.0 MiB",
+                "*= top 10 subtest memory peaks =*",
+                "* 1 failed, 1 passed, 1 subtests passed in *",
+            ]
+        )
+
+    @pytest.mark.parametrize("how", ["option", "attribute", "argument"])
+    def test_maxfail(
+        self,
+        pytester: pytest.Pytester,
+        mode: Literal["normal", "xdist"],
+        how: Literal["option", "attribute", "argument"],
+    ) -> None:
+        pytester.makepyfile(
+            f"""
+            def test_foo(subtests):
+                if {how!r} == "attribute":
+                    subtests.maxfail = 2
+                skipped = []
+                for i in range(10):
+                    kwargs = {{"maxfail": 2}} if {how!r} == "argument" else {{}}
+                    with subtests.test("max", i=i, **kwargs) as subtest:
+                        skipped.append(subtest.skipped)
+                        if subtest.skipped:
+                            continue
+                        assert i == 1
+                assert skipped == [False] * 3 + [True] * 7
+            """
+        )
+        args = ["-v", "-rs"]
+        if how == "option":
+            args.append("--subtests-maxfail=2")
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        result = pytester.runpytest(*args)
+        if mode == "normal":
+            expected_lines = [
+                "*::test_foo [[]max[]] (i=0) SUBFAIL *",
+                "*::test_foo [[]max[]] (i=1) SUBPASS *",
+                "*::test_foo [[]max[]] (i=2) SUBFAIL *",
+                "*::test_foo [[]7 subtests skipped[]] SUBSKIP (maxfail*",
+                "*::test_foo PASSED *",
+            ]
+        else:
+            expected_lines = [
+                "*gw0*100%* SUBFAIL test_maxfail.py::test_foo*",
+                "*gw0*100%* SUBPASS test_maxfail.py::test_foo*",
+                "*gw0*100%* SUBFAIL test_maxfail.py::test_foo*",
+                "*gw0*100%* SUBSKIP test_maxfail.py::test_foo*",
+                "*gw0*100%* PASSED test_maxfail.py::test_foo*",
+            ]
+        expected_lines += [
+            "*short test summary info*",
+            "* SUBSKIP [[]1[]] test_maxfail.py:1: maxfail reached after 2 failed subtests",
+            "* 2 failed, 1 passed, 1 skipped, 1 subtests passed in *",
+        ]
+        result.stdout.fnmatch_lines(expected_lines)
+        result.stdout.no_fnmatch_line("*(i=3)*")
+
+    def test_maxfail_body_raises(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        pytester.makepyfile(
+            """
+            def test_foo(subtests):
+                for i in range(10):
+                    with subtests.test(i=i):
+                        assert False
+            """
+        )
+        args = ["-rs", "--subtests-maxfail=2"]
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        result = pytester.runpytest(*args)
+        result.stdout.fnmatch_lines(
+            [
+                "*[[]8 subtests skipped[]] SUBSKIP [[]1[]] test_maxfail_body_raises.py:1: maxfail reached after 2 failed subtests",
+                "* 2 failed, 1 passed, 1 skipped in *",
+            ]
+        )
+        result.stdout.no_fnmatch_line("*(i=2)*")
+
+    def test_maxfail_zero(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        """maxfail=0 means no limit, and lifts the limit of --subtests-maxfail; it cannot be negative."""
+        pytester.makepyfile(
+            """
+            def test_foo(subtests):
+                for i in range(5):
+                    with subtests.test(i=i):
+                        assert False
+                for i in range(5):
+                    with subtests.test(i=i, maxfail=0):
+                        assert False
+            """
+        )
+        args = []
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        result = pytester.runpytest("--subtests-maxfail=0", *args)
+        result.stdout.fnmatch_lines(["* 10 failed, 1 passed in *"])
+        result = pytester.runpytest("--subtests-maxfail=1", *args)
+        result.stdout.fnmatch_lines(["* 6 failed, 1 passed, 1 skipped in *"])
+
+        result = pytester.runpytest("--subtests-maxfail=-1", *args)
+        assert result.ret == pytest.ExitCode.USAGE_ERROR
+        result.stderr.fnmatch_lines(["*argument --subtests-maxfail: *"])
+
+    @pytest.mark.parametrize("color", ["yes", "no"])
+    def test_progress_counter(
+        self,
+        pytester: pytest.Pytester,
+        monkeypatch: pytest.MonkeyPatch,
+        mode: Literal["normal", "xdist"],
+        color: Literal["yes", "no"],
+    ) -> None:
+        from pytest_subtests.plugin import SubTestsProgress
+
+        # Updated for every subtest, whatever their speed.
+        monkeypatch.setattr(SubTestsProgress, "interval", 0)
+        pytester.makepyfile(
+            """
+            def test_foo(subtests):
+                for i in range(3):
+                    with subtests.test(i=i):
+                        assert i != 1
+            """
+        )
+        args = ["--subtests-progress=counter", f"--color={color}"]
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        result = pytester.runpytest(*args)
+        output = result.stdout.str()
+        counters = [
+            f" test_foo: {passed} passed, {failed} failed, 0 skipped"
+            for passed, failed in ((1, 0), (1, 1), (2, 1))
+        ]
+        if color == "yes":
+            for counter in counters:
+                assert f"\x1b[K{counter}" in output
+            # One update per subtest, then erased before the letter of the test.
+            assert output.count("\x1b[K") == 4
+        else:
+            assert counters[0] not in output
+            assert "\x1b[K" not in output
+        assert ",u," not in output
+        result.stdout.fnmatch_lines(
+            ["*1 failed*, *1 passed*, *2 subtests passed* in *"]
+        )
+
+    def test_retain_failed(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        pytester.makeconftest(
+            """
+            def pytest_terminal_summary(terminalreporter):
+                kept = {
+                    category: sorted({type(report).__name__ for report in reports})
+                    for category, reports in terminalreporter.stats.items()
+                    if category in ("subtests passed", "skipped", "failed")
+                }
+                terminalreporter.write_line(f"kept: {kept}")
+                retained = [
+                    report
+                    for reports in terminalreporter.stats.values()
+                    for report in reports
+                    if type(report).__name__ == "RetainedSubTestReport"
+                ]
+                assert not any(hasattr(report, "__dict__") for report in retained)
+            """
+        )
+        pytester.makepyfile(
+            """
+            import pytest
+
+            def test_foo(subtests):
+                for i in range(3):
+                    with subtests.test(i=i):
+                        if i == 2:
+                            pytest.skip("skip 2")
+                        assert i != 1
+            """
+        )
+        args = ["-rspP", "--subtests-retain=failed"]
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        result = pytester.runpytest(*args)
+        assert (
+            "kept: {'subtests passed': ['RetainedSubTestReport'], "
+            "'failed': ['SubTestReport'], 'skipped': ['RetainedSubTestReport']}"
+        ) in result.stdout.lines
+        result.stdout.fnmatch_lines(
+            [
+                "*short test summary info*",
+                "* SUBSKIP [[]1[]] test_retain_failed.py:7: skip 2",
+                "* 1 failed, 1 passed, 1 skipped, 1 subtests passed in *",
+            ]
+        )
+
+    def test_junitxml(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        pytester.makepyfile(
+            """
+            import pytest
+
+            def test_foo(subtests):
+                for i in range(3):
+                    with subtests.test("junit", i=i):
+                        print(f"stdout {i}")
+                        if i == 2:
+                            pytest.skip("skip <2>")
+                        assert i != 1
+            """
+        )
+        args = ["--subtests-junitxml=reports/subtests.xml"]
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        result = pytester.runpytest(*args)
+        result.stdout.fnmatch_lines(
+            ["*- generated subtests xml file: *subtests.xml -*"]
+        )
+        assert not (pytester.path / "reports/subtests.xml.part").exists()
+        root = ElementTree.parse(pytester.path / "reports/subtests.xml").getroot()
+        [suite] = root.findall("testsuite")
+        assert {key: suite.get(key) for key in ("tests", "failures", "skipped")} == {
+            "tests": "3",
+            "failures": "1",
+            "skipped": "1",
+        }
+        testcases = suite.findall("testcase")
+        assert [testcase.get("classname") for testcase in testcases] == [
+            "test_junitxml"
+        ] * 3
+        assert [testcase.get("name") for testcase in testcases] == [
+            "test_foo [junit] (i=0)",
+            "test_foo [junit] (i=1)",
+            "test_foo [junit] (i=2)",
+        ]
+        assert [child.tag for child in testcases[0]] == ["system-out"]
+        assert testcases[0].findtext("system-out") == "stdout 0\n"
+        failure = testcases[1].find("failure")
+        assert failure is not None
+        assert failure.get("message") == "assert 1 != 1"
+        assert "AssertionError" in (failure.text or "")
+        skipped = testcases[2].find("skipped")
+        assert skipped is not None
+        assert skipped.get("message") == "skip <2>"
+        assert (skipped.text or "").endswith("test_junitxml.py:8: skip <2>")
+
+    def test_junitxml_aggregated(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        pytester.makepyfile(
+            """
+            def test_foo(subtests):
+                for i in range(5):
+                    with subtests.test(i=i):
+                        assert i != 4
+            """
+        )
+        args = ["--subtests-junitxml=subtests.xml", "--subtests-aggregate"]
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        pytester.runpytest(*args)
+        root = ElementTree.parse(pytester.path / "subtests.xml").getroot()
+        [suite] = root.findall("testsuite")
+        assert (suite.get("tests"), suite.get("failures")) == ("5", "1")
+        assert len(suite.findall("testcase")) == 2
+
+    @pytest.mark.parametrize("how", ["option", "argument"])
+    def test_timeout(
+        self,
+        pytester: pytest.Pytester,
+        mode: Literal["normal", "xdist"],
+        how: Literal["option", "argument"],
+    ) -> None:
+        pytester.makepyfile(
+            f"""
+            import time
+
+            def test_foo(subtests):
+                for i in range(3):
+                    kwargs = {{"timeout": 0.2}} if {how!r} == "argument" else {{}}
+                    with subtests.test("timeout", i=i, **kwargs):
+                        if i == 1:
+                            time.sleep(30)
+            """
+        )
+        args = ["-v"]
+        if how == "option":
+            args.append("--subtests-timeout=0.2")
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        result = pytester.runpytest(*args)
+        if mode == "normal":
+            expected_lines = [
+                "*::test_foo [[]timeout[]] (i=0) SUBPASS *",
+                "*::test_foo [[]timeout[]] (i=1) SUBFAIL *",
+                "*::test_foo [[]timeout[]] (i=2) SUBPASS *",
+                "*::test_foo PASSED *",
+            ]
+        else:
+            expected_lines = [
+                "*gw0*100%* SUBPASS test_timeout.py::test_foo*",
+                "*gw0*100%* SUBFAIL test_timeout.py::test_foo*",
+                "*gw0*100%* SUBPASS test_timeout.py::test_foo*",
+                "*gw0*100%* PASSED test_timeout.py::test_foo*",
+            ]
+        expected_lines += [
+            "* test_foo [[]timeout[]] (i=1) *",
+            ">                   time.sleep(30)",
+            "E                   Failed: Timeout: subtest ran for more than 0.2s",
+            "* 1 failed, 1 passed, 2 subtests passed in *",
+        ]
+        result.stdout.fnmatch_lines(expected_lines)
+
+    def test_timeout_after_body(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        """The timeout does not interrupt the subtest once its body is over."""
+        pytester.makepyfile(
+            """
+            import time
+
+            from _pytest._code import ExceptionInfo
+            from pytest_subtests import plugin
+
+            class SlowExceptionInfo(ExceptionInfo):
+                @classmethod
+                def from_exception(cls, exception, exprinfo=None):
+                    time.sleep(0.5)
+                    return ExceptionInfo.from_exception(exception, exprinfo)
+
+            def test_foo(subtests, monkeypatch):
+                monkeypatch.setattr(plugin, "ExceptionInfo", SlowExceptionInfo)
+                with subtests.test("timeout", timeout=0.2):
+                    raise ValueError("in body")
+            """
+        )
+        args = []
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        result = pytester.runpytest(*args)
+        result.stdout.fnmatch_lines(
+            [
+                "E *ValueError: in body",
+                "* 1 failed, 1 passed in *",
+            ]
+        )
+        result.stdout.no_fnmatch_line("*Timeout*")
+
+    def test_timeout_concurrent(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        pytester.makepyfile(
+            """
+            import asyncio
+            import threading
+            import time
+
+            released = threading.Event()
+
+            def stuck_in_thread(i):
+                if i == 1:
+                    released.wait(30)
+
+            def stuck_in_process(i):
+                if i == 1:
+                    time.sleep(30)
+
+            async def stuck_coroutine(i):
+                if i == 1:
+                    await asyncio.sleep(30)
+
+            async def gather(subtests):
+                await subtests.gather(*(stuck_coroutine(i) for i in range(2)), msg="gather")
+
+            def test_foo(subtests):
+                subtests.timeout = 0.2
+                try:
+                    subtests.map(stuck_in_thread, range(2), msg="thread")
+                finally:
+                    released.set()
+                subtests.map(stuck_in_process, range(2), msg="process", executor="process")
+                asyncio.run(gather(subtests))
+            """
+        )
+        args = []
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        result = pytester.runpytest(*args)
+        result.stdout.fnmatch_lines(
+            [
+                "* test_foo [[]thread[]] (item=1) *",
+                "Timeout: subtest ran for more than 0.2s, stack when it timed out:",
+                "*, in stuck_in_thread",
+                "    released.wait(30)",
+                "* test_foo [[]process[]] (item=1) *",
+                ">           time.sleep(30)",
+                "E           Failed: Timeout: subtest ran for more than 0.2s",
+                "* test_foo [[]gather[]] (index=1) *",
+                "Timeout: subtest ran for more than 0.2s, stack when it timed out:",
+                "*, in stuck_coroutine",
+                "    await asyncio.sleep(30)",
+                "*, in sleep",
+                "* 3 failed, 1 passed, 3 subtests passed in *",
+            ]
+        )
+
+    def test_timeout_exit(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        """A call of map() left running after a timeout does not keep pytest from exiting."""
+        pytester.makepyfile(
+            """
+            import time
+
+            def stuck(i):
+                if i == 1:
+                    time.sleep(30)
+
+            def test_foo(subtests):
+                subtests.timeout = 0.5
+                subtests.map(stuck, range(2), msg="thread")
+            """
+        )
+        args = []
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        # Raises Pytester.TimeoutExpired if the stuck call keeps the process alive.
+        result = pytester.runpytest_subprocess(*args, timeout=20)
+        result.stdout.fnmatch_lines(["* 1 failed, 1 passed, 1 subtests passed in *"])
+
+    def test_iterate(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        pytester.makepyfile(
+            """
+            pulled = []
+
+            def records():
+                for i in range(3):
+                    pulled.append(i)
+                    yield {"name": f"record{i}", "data": list(range(100)), "value": i}
+
+            def test_foo(subtests):
+                subtests_iterator = subtests.iterate(
+                    records(),
+                    id=lambda record: record["name"],
+                    kwargs=lambda record: {"data": record["data"]},
+                    msg="iterate",
+                )
+                for subtest in subtests_iterator:
+                    with subtest as record:
+                        # Items are pulled one at a time.
+                        assert pulled[-1] == record["value"]
+                        assert record["value"] != 1
+
+                for subtest in subtests.iterate("ab"):
+                    with subtest as letter:
+                        assert letter == "a"
+            """
+        )
+        args = ["-v"]
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        result = pytester.runpytest(*args)
+        result.stdout.fnmatch_lines(
+            [
+                "* test_foo [[]iterate[]] (data='[[]0, 1, 2, 3, 4, 5, ...[]]', id='record1') *",
+                "E * assert 1 != 1",
+                "* test_foo (index=1) *",
+                "E * AssertionError: assert 'b' == 'a'",
+                "* 2 failed, 1 passed, 3 subtests passed in *",
+            ]
+        )
+
+    def test_check_all(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        pytester.makepyfile(
+            """
+            def test_foo(subtests):
+                failed = subtests.check_all([1, 2, 3, 4], [1, 0, 3, 5], ids="abcd", msg="exact")
+                assert failed == 2
+                assert subtests.check_all([0.5, 1.0001, 1.1], 1.0, rtol=1e-3) == 2
+                results = (
+                    ({"n": n}, None if n % 4 else f"{n} is a multiple of 4") for n in range(1, 10)
+                )
+                assert subtests.record_batch(results, msg="batch") == 2
+            """
+        )
+        args = []
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        result = pytester.runpytest(*args)
+        result.stdout.fnmatch_lines(
+            [
+                "* test_foo [[]exact[]] (id='b') *",
+                "2 != 0",
+                "* test_foo [[]exact[]] (id='d') *",
+                "4 != 5",
+                "* test_foo (index=0) *",
+                "0.5 is not close to 1.0 (rtol=0.001, atol=0)",
+                "* test_foo (index=2) *",
+                "1.1 is not close to 1.0 (rtol=0.001, atol=0)",
+                "* test_foo [[]batch[]] (n=4) *",
+                "4 is a multiple of 4",
+                "* test_foo [[]batch[]] (n=8) *",
+                "8 is a multiple of 4",
+                # The passing checks are reported as one subtest each time, but counted individually.
+                "* 6 failed, 1 passed, 10 subtests passed in *",
+            ]
+        )
+
+    def test_check_all_numpy(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        # Not imported here: NumPy cannot be imported again by the in-process runs of pytester,
+        # which unload the modules imported by the test.
+        if importlib.util.find_spec("numpy") is None:
+            pytest.skip("numpy is not installed")
+        pytester.makepyfile(
+            """
+            import numpy as np
+
+            def test_foo(subtests):
+                actual = np.arange(12.0).reshape(3, 4)
+                expected = actual.copy()
+                expected[1, 2] = -1
+                assert subtests.check_all(actual, expected) == 1
+                assert subtests.check_all(np.arange(5), 2, ids=np.array(list("abcde"))) == 4
+                assert subtests.check_all(actual, actual * (1 + 1e-9), rtol=1e-6) == 0
+            """
+        )
+        args = []
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        result = pytester.runpytest_subprocess(*args)
+        result.stdout.fnmatch_lines(
+            [
+                "* test_foo (index=(1, 2)) *",
+                "6.0 != -1.0",
+                "* test_foo (id='a') *",
+                "0 != 2",
+                "* 5 failed, 1 passed, 24 subtests passed in *",
+            ]
+        )
+
+    def test_map(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        pytester.makepyfile(
+            """
+            import threading
+
+            def test_foo(subtests):
+                # All calls must be running at the same time to get past the barrier.
+                barrier = threading.Barrier(3, timeout=10)
+
+                def check(i):
+                    barrier.wait()
+                    assert i != 1
+                    return i * 2
+
+                assert subtests.map(check, range(3), msg="map", max_workers=3) == [0, None, 4]
+            """
+        )
+        if mode == "normal":
+            result = pytester.runpytest("-v")
+            expected_lines = [
+                "*collected 1 item",
+                "test_map.py::test_foo [[]map[]] (item=0) SUBPASS *100%*",
+                "test_map.py::test_foo [[]map[]] (item=1) SUBFAIL *100%*",
+                "test_map.py::test_foo [[]map[]] (item=2) SUBPASS *100%*",
+                "test_map.py::test_foo PASSED *100%*",
+            ]
+        else:
+            assert mode == "xdist"
+            pytest.importorskip("xdist")
+            result = pytester.runpytest("-n1", "-v")
+            expected_lines = [
+                "1 worker [1 item]",
+                "*gw0*100%* SUBPASS test_map.py::test_foo*",
+                "*gw0*100%* SUBFAIL test_map.py::test_foo*",
+                "*gw0*100%* SUBPASS test_map.py::test_foo*",
+                "*gw0*100%* PASSED test_map.py::test_foo*",
+            ]
+        expected_lines += [
+            "* test_foo [[]map[]] (item=1) *",
+            ">       assert i != 1",
+            "E       assert 1 != 1",
+            "* 1 failed, 1 passed, 2 subtests passed in *",
+        ]
+        result.stdout.fnmatch_lines(expected_lines)
+
+    def test_map_processes(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        pytester.makepyfile(
+            """
+            import logging
+            import os
+            import pytest
+
+            def check(i):
+                print(f"stdout {i}")
+                logging.warning(f"logging {i}")
+                if i == 2:
+                    pytest.skip("skip 2")
+                assert i != 1
+                return os.getpid()
+
+            def test_foo(subtests):
+                pids = subtests.map(check, range(4), msg="map", executor="process")
+                assert pids[1] is None and pids[2] is None
+                assert os.getpid() not in pids
+            """
+        )
+        if mode == "normal":
+            result = pytester.runpytest("-v", "-rs")
+            expected_lines = [
+                "*collected 1 item",
+                "test_map_processes.py::test_foo [[]map[]] (item=0) SUBPASS *100%*",
+                "test_map_processes.py::test_foo [[]map[]] (item=1) SUBFAIL *100%*",
+                "test_map_processes.py::test_foo [[]map[]] (item=2) SUBSKIP (skip 2) *100%*",
+                "test_map_processes.py::test_foo [[]map[]] (item=3) SUBPASS *100%*",
+                "test_map_processes.py::test_foo PASSED *100%*",
+            ]
+        else:
+            assert mode == "xdist"
+            pytest.importorskip("xdist")
+            result = pytester.runpytest("-n1", "-v", "-rs")
+            expected_lines = [
+                "1 worker [1 item]",
+                "*gw0*100%* SUBPASS test_map_processes.py::test_foo*",
+                "*gw0*100%* SUBFAIL test_map_processes.py::test_foo*",
+                "*gw0*100%* SUBSKIP test_map_processes.py::test_foo*",
+                "*gw0*100%* SUBPASS test_map_processes.py::test_foo*",
+                "*gw0*100%* PASSED test_map_processes.py::test_foo*",
+            ]
+        expected_lines += [
+            "* test_foo [[]map[]] (item=1) *",
+            ">       assert i != 1",
+            "E       assert 1 != 1",
+            "test_map_processes.py:10: AssertionError",
+            "*- Captured stdout call -*",
+            "stdout 1",
+            "*- Captured log call -*",
+            "WARNING  root:test_map_processes.py:7 logging 1",
+            "*short test summary info*",
+            "* SUBSKIP [[]1[]] test_map_processes.py:9: skip 2",
+            "* 1 failed, 1 passed, 1 skipped, 2 subtests passed in *",
+        ]
+        result.stdout.fnmatch_lines(expected_lines)
+
+    def test_async_with(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        pytester.makepyfile(
+            """
+            import asyncio
+
+            async def check(subtests):
+                for i in range(3):
+                    async with subtests.test(msg="async", i=i):
+                        await asyncio.sleep(0)
+                        print(f"stdout {i}")
+                        assert i != 1
+
+            def test_foo(subtests):
+                asyncio.run(check(subtests))
+            """
+        )
+        if mode == "normal":
+            result = pytester.runpytest("-v")
+            expected_lines = [
+                "*collected 1 item",
+                "test_async_with.py::test_foo [[]async[]] (i=0) SUBPASS *100%*",
+                "test_async_with.py::test_foo [[]async[]] (i=1) SUBFAIL *100%*",
+                "test_async_with.py::test_foo [[]async[]] (i=2) SUBPASS *100%*",
+                "test_async_with.py::test_foo PASSED *100%*",
+            ]
+        else:
+            assert mode == "xdist"
+            pytest.importorskip("xdist")
+            result = pytester.runpytest("-n1", "-v")
+            expected_lines = [
+                "1 worker [1 item]",
+                "*gw0*100%* SUBPASS test_async_with.py::test_foo*",
+                "*gw0*100%* SUBFAIL test_async_with.py::test_foo*",
+                "*gw0*100%* SUBPASS test_async_with.py::test_foo*",
+                "*gw0*100%* PASSED test_async_with.py::test_foo*",
+            ]
+        expected_lines += [
+            "* test_foo [[]async[]] (i=1) *",
+            ">               assert i != 1",
+            "E               assert 1 != 1",
+            "*- Captured stdout call -*",
+            "stdout 1",
+            "* 1 failed, 1 passed, 2 subtests passed in *",
+        ]
+        result.stdout.fnmatch_lines(expected_lines)
+
+    def test_gather(
+        self, pytester: pytest.Pytester, mode: Literal["normal", "xdist"]
+    ) -> None:
+        pytester.makepyfile(
+            """
+            import asyncio
+            import pytest
+
+            async def check(i, barrier):
+                # Both coroutines allowed by the limit must be running at the same time.
+                barrier.append(i)
+                while len(barrier) < 2:
+                    await asyncio.sleep(0)
+                if i == 2:
+                    pytest.skip("skip 2")
+                assert i != 1
+                return i * 2
+
+            async def gather(subtests):
+                barrier = []
+                coros = [check(i, barrier) for i in range(4)]
+                return await subtests.gather(*coros, limit=2, msg="gather")
+
+            def test_foo(subtests):
+                assert asyncio.run(gather(subtests)) == [0, None, None, 6]
+            """
+        )
+        if mode == "normal":
+            result = pytester.runpytest("-v")
+            expected_lines = [
+                "*collected 1 item",
+                "test_gather.py::test_foo [[]gather[]] (index=0) SUBPASS *100%*",
+                "test_gather.py::test_foo [[]gather[]] (index=1) SUBFAIL *100%*",
+                "test_gather.py::test_foo [[]gather[]] (index=2) SUBSKIP (skip 2) *100%*",
+                "test_gather.py::test_foo [[]gather[]] (index=3) SUBPASS *100%*",
+                "test_gather.py::test_foo PASSED *100%*",
+            ]
+        else:
+            assert mode == "xdist"
+            pytest.importorskip("xdist")
+            result = pytester.runpytest("-n1", "-v")
+            expected_lines = [
+                "1 worker [1 item]",
+                "*gw0*100%* SUBPASS test_gather.py::test_foo*",
+                "*gw0*100%* SUBFAIL test_gather.py::test_foo*",
+                "*gw0*100%* SUBSKIP test_gather.py::test_foo*",
+                "*gw0*100%* SUBPASS test_gather.py::test_foo*",
+                "*gw0*100%* PASSED test_gather.py::test_foo*",
+            ]
+        expected_lines += [
+            "* test_foo [[]gather[]] (index=1) *",
+            ">       assert i != 1",
+            "E       assert 1 != 1",
+            "* 1 failed, 1 passed, 1 skipped, 2 subtests passed in *",
+        ]
+        result.stdout.fnmatch_lines(expected_lines)
+
 
 class TestSubTest:
     """
@@ -567,8 +1558,61 @@ class TestSubTest:
                 ["collected 1 item", "* 3 skipped, 1 passed in *"]
             )
 
+    @pytest.mark.skipif(IS_PY311, reason="the outcome is not scanned on python 3.11+")
+    @pytest.mark.parametrize("count", [10, 1000])
+    def test_outcome_scanned_once(self, pytester: pytest.Pytester, count: int) -> None:
+        """The unittest outcome is scanned once per test, not once per subtest (quadratic)."""
+        pytester.makeconftest(
+            """
+            import unittest.case
+
+            class CountingList(list):
+                iterations = 0
 
+                def __iter__(self):
+                    CountingList.iterations += 1
+                    return super().__iter__()
+
+            original_init = unittest.case._Outcome.__init__
+
+            def __init__(self, *args, **kwargs):
+                original_init(self, *args, **kwargs)
+                self.errors = CountingList()
+                self.skipped = CountingList()
+
+            unittest.case._Outcome.__init__ = __init__
+
+            def pytest_terminal_summary(terminalreporter):
+                terminalreporter.write_line(f"iterations: {CountingList.iterations}")
+            """
+        )
+        pytester.makepyfile(
+            f"""
+            from unittest import TestCase
+
+            class T(TestCase):
+                def test_foo(self):
+                    for i in range({count}):
+                        with self.subTest(i=i):
+                            if i % 3 == 0:
+                                self.skipTest("skip")
+                            assert i % 3 == 1
+                    self.skipTest("skip the test")
+            """
+        )
+        result = pytester.runpytest("-rs")
+        # The skip of the test itself is only added after the last subtest failure.
+        result.stdout.fnmatch_lines(["*SUBSKIP * skip the test"])
+        # Once by unittest to feed each list to the result, once by the plugin for each.
+        result.stdout.fnmatch_lines(["iterations: 4"])
+
+
+@pytest.mark.parametrize("shared", [False, True], ids=["per-subtest", "shared"])
 class TestCapture:
+    @pytest.fixture
+    def capture_args(self, shared: bool) -> list[str]:
+        return ["--subtests-shared-capture"] if shared else []
+
     def create_file(self, pytester: pytest.Pytester) -> None:
         pytester.makepyfile(
             """
@@ -582,80 +1626,615 @@ class TestCapture:
                             print("hello stderr A", file=sys.stderr)
                             assert 0
 
-                        with subtests.test(i='B'):
-                            print("hello stdout B")
-                            print("hello stderr B", file=sys.stderr)
-                            assert 0
+                        with subtests.test(i='B'):
+                            print("hello stdout B")
+                            print("hello stderr B", file=sys.stderr)
+                            assert 0
+
+                        print('end test')
+                        assert 0
+                """
+        )
+
+    @pytest.mark.parametrize("capture", ["fd", "sys"])
+    def test_capturing(
+        self, pytester: pytest.Pytester, capture_args: list[str], capture: str
+    ) -> None:
+        self.create_file(pytester)
+        result = pytester.runpytest(f"--capture={capture}", *capture_args)
+        result.stdout.fnmatch_lines(
+            [
+                "*__ test (i='A') __*",
+                "*Captured stdout call*",
+                "hello stdout A",
+                "*Captured stderr call*",
+                "hello stderr A",
+                "*__ test (i='B') __*",
+                "*Captured stdout call*",
+                "hello stdout B",
+                "*Captured stderr call*",
+                "hello stderr B",
+                "*__ test __*",
+                "*Captured stdout call*",
+                "start test",
+                "end test",
+            ]
+        )
+
+    def test_no_capture(
+        self, pytester: pytest.Pytester, capture_args: list[str]
+    ) -> None:
+        self.create_file(pytester)
+        result = pytester.runpytest("-s", *capture_args)
+        result.stdout.fnmatch_lines(
+            [
+                "start test",
+                "hello stdout A",
+                "uhello stdout B",
+                "uend test",
+                "*__ test (i='A') __*",
+                "*__ test (i='B') __*",
+                "*__ test __*",
+            ]
+        )
+        result.stderr.fnmatch_lines(["hello stderr A", "hello stderr B"])
+
+    @pytest.mark.parametrize("fixture", ["capsys", "capfd"])
+    def test_capture_with_fixture(
+        self,
+        pytester: pytest.Pytester,
+        capture_args: list[str],
+        fixture: Literal["capsys", "capfd"],
+    ) -> None:
+        pytester.makepyfile(
+            rf"""
+            import sys
+
+            def test(subtests, {fixture}):
+                print('start test')
+
+                with subtests.test(i='A'):
+                    print("hello stdout A")
+                    print("hello stderr A", file=sys.stderr)
+
+                out, err = {fixture}.readouterr()
+                assert out == 'start test\nhello stdout A\n'
+                assert err == 'hello stderr A\n'
+            """
+        )
+        result = pytester.runpytest(*capture_args)
+        result.stdout.fnmatch_lines(
+            [
+                "*1 passed*",
+            ]
+        )
+
+    def test_unittest(self, pytester: pytest.Pytester, capture_args: list[str]) -> None:
+        """self.subTest() blocks are timed and get their own output and log records."""
+        pytester.makepyfile(
+            """
+            import logging
+            import sys
+            import time
+            from unittest import TestCase
+
+            class T(TestCase):
+                def test_foo(self):
+                    print('start test')
+                    for i in range(2):
+                        with self.subTest(i=i):
+                            print(f"hello stdout {i}")
+                            print(f"hello stderr {i}", file=sys.stderr)
+                            logging.warning(f"hello log {i}")
+                            time.sleep(0.05 * i)
+                            self.assertEqual(i, -1)
+                    print('end test')
+            """
+        )
+        result = pytester.runpytest(
+            "--subtests-durations=1", "--subtests-durations-min=0.01", *capture_args
+        )
+        result.stdout.fnmatch_lines(
+            [
+                "*__ T.test_foo (i=0) __*",
+                "*Captured stdout call*",
+                "hello stdout 0",
+                "*Captured stderr call*",
+                "hello stderr 0",
+                "*Captured log call*",
+                "*hello log 0",
+                "*__ T.test_foo (i=1) __*",
+                "*Captured stdout call*",
+                "hello stdout 1",
+                "*Captured stderr call*",
+                "hello stderr 1",
+                "*Captured log call*",
+                "*hello log 1",
+                "*= slowest 1 subtest durations =*",
+                "0.0*s test_unittest.py::T::test_foo (i=1)",
+                "* 2 failed, 1 passed in *",
+            ]
+        )
+
+    @pytest.mark.parametrize("option", ["no", "inherit"])
+    def test_subtests_capture(
+        self, pytester: pytest.Pytester, capture_args: list[str], option: str
+    ) -> None:
+        """Output of subtests not captured goes to the output captured for the test."""
+        pytester.makepyfile(
+            """
+            import logging
+
+            def test(subtests):
+                print('start test')
+                with subtests.test(i='A'):
+                    print("hello stdout A")
+                    logging.warning("hello log A")
+                    assert 0
+                with subtests.test(i='B', capture=False):
+                    print("hello stdout B")
+                    assert 0
+                with subtests.test(i='C', capture=True):
+                    print("hello stdout C")
+                    assert 0
+                print('end test')
+                assert 0
+            """
+        )
+        result = pytester.runpytest(f"--subtests-capture={option}", *capture_args)
+        if option == "no":
+            result.stdout.fnmatch_lines(
+                [
+                    "*__ test (i='A') __*",
+                    "*__ test (i='B') __*",
+                    "*__ test (i='C') __*",
+                    "*Captured stdout call*",
+                    "hello stdout C",
+                    "*__ test __*",
+                    "*Captured stdout call*",
+                    "start test",
+                    "hello stdout A",
+                    "hello stdout B",
+                    "end test",
+                    "*Captured log call*",
+                    "*hello log A",
+                ]
+            )
+        else:
+            result.stdout.fnmatch_lines(
+                [
+                    "*__ test (i='A') __*",
+                    "*Captured stdout call*",
+                    "hello stdout A",
+                    "*Captured log call*",
+                    "*hello log A",
+                    "*__ test (i='B') __*",
+                    "*__ test (i='C') __*",
+                    "*Captured stdout call*",
+                    "hello stdout C",
+                    "*__ test __*",
+                    "*Captured stdout call*",
+                    "start test",
+                    "hello stdout B",
+                    "end test",
+                ]
+            )
+        result.stdout.fnmatch_lines(["* 4 failed in *"])
+
+    def test_subtests_capture_unittest(
+        self, pytester: pytest.Pytester, capture_args: list[str]
+    ) -> None:
+        pytester.makepyfile(
+            """
+            from unittest import TestCase
 
-                        print('end test')
-                        assert 0
-                """
+            class T(TestCase):
+                def test_foo(self):
+                    print('start test')
+                    with self.subTest(i=0):
+                        print("hello stdout 0")
+                        self.assertEqual(0, -1)
+                    print('end test')
+                    self.fail()
+            """
+        )
+        result = pytester.runpytest("--subtests-capture=no", *capture_args)
+        result.stdout.fnmatch_lines(
+            [
+                "*__ T.test_foo (i=0) __*",
+                "*__ T.test_foo __*",
+                "*Captured stdout call*",
+                "start test",
+                "hello stdout 0",
+                "end test",
+                "* 2 failed in *",
+            ]
         )
 
-    def test_capturing(self, pytester: pytest.Pytester) -> None:
+    def test_subtests_capture_sys(
+        self, pytester: pytest.Pytester, capture_args: list[str]
+    ) -> None:
+        """--subtests-capture=sys captures subtests even with --capture=no."""
         self.create_file(pytester)
-        result = pytester.runpytest()
+        result = pytester.runpytest(
+            "--capture=no", "--subtests-capture=sys", *capture_args
+        )
         result.stdout.fnmatch_lines(
             [
+                "start test",
+                "uuend test",
                 "*__ test (i='A') __*",
                 "*Captured stdout call*",
                 "hello stdout A",
                 "*Captured stderr call*",
                 "hello stderr A",
-                "*__ test (i='B') __*",
+            ]
+        )
+
+
+class TestSharedCapture:
+    """
+    Tests specific to ``--subtests-shared-capture``.
+    """
+
+    def test_nested_subtests(self, pytester: pytest.Pytester) -> None:
+        pytester.makepyfile(
+            """
+            def test(subtests):
+                print("start test")
+                with subtests.test("outer"):
+                    print("outer before")
+                    with subtests.test("inner"):
+                        print("inner")
+                        assert 0
+                    print("outer after")
+                    assert 0
+                print("end test")
+                assert 0
+            """
+        )
+        result = pytester.runpytest("--subtests-shared-capture")
+        result.stdout.fnmatch_lines(
+            [
+                "*__ test [[]inner[]] __*",
                 "*Captured stdout call*",
-                "hello stdout B",
-                "*Captured stderr call*",
-                "hello stderr B",
+                "inner",
+                "*__ test [[]outer[]] __*",
+                "*Captured stdout call*",
+                "outer before",
+                "outer after",
                 "*__ test __*",
                 "*Captured stdout call*",
                 "start test",
                 "end test",
+                "*short test summary info*",
             ]
         )
 
-    def test_no_capture(self, pytester: pytest.Pytester) -> None:
-        self.create_file(pytester)
-        result = pytester.runpytest("-s")
-        result.stdout.fnmatch_lines(
+
+class TestSharding:
+    @pytest.fixture
+    def sharded_script(self, pytester: pytest.Pytester) -> None:
+        pytester.makepyfile(
+            """
+            import asyncio
+
+            def test_foo(subtests):
+                for i in range(10):
+                    with subtests.test("sync", i=i):
+                        pass
+                    with subtests.test("one line", i=i): assert i >= 0
+
+            def test_bar(subtests):
+                async def run():
+                    for i in range(10):
+                        async with subtests.test("async", i=i):
+                            await asyncio.sleep(0)
+                    await subtests.gather(
+                        *(asyncio.sleep(0) for i in range(10)), msg="gather"
+                    )
+                asyncio.run(run())
+
+            def test_map(subtests):
+                subtests.map(lambda i: i, range(10), msg="map")
+            """
+        )
+
+    def test_shards(self, sharded_script: None, pytester: pytest.Pytester) -> None:
+        ran: list[str] = []
+        for index in range(3):
+            result = pytester.runpytest("-v", f"--subtests-shard={index}/3")
+            # Subtests of the other shards are not reported.
+            passed = [line for line in result.outlines if " SUBPASS " in line]
+            assert result.parseoutcomes().get("subtests", 0) == len(passed)
+            ran += [line.split(" SUBPASS ")[0].split(" ", 1)[1] for line in passed]
+        assert sorted(ran) == sorted(
             [
-                "start test",
-                "hello stdout A",
-                "uhello stdout B",
-                "uend test",
-                "*__ test (i='A') __*",
-                "*__ test (i='B') __*",
-                "*__ test __*",
+                f"[{name}] (i={i})"
+                for name in ("sync", "one line", "async")
+                for i in range(10)
             ]
+            + [f"[gather] (index={i})" for i in range(10)]
+            + [f"[map] (item={i})" for i in range(10)]
         )
-        result.stderr.fnmatch_lines(["hello stderr A", "hello stderr B"])
 
-    @pytest.mark.parametrize("fixture", ["capsys", "capfd"])
-    def test_capture_with_fixture(
-        self, pytester: pytest.Pytester, fixture: Literal["capsys", "capfd"]
+    def test_auto(self, sharded_script: None, pytester: pytest.Pytester) -> None:
+        pytest.importorskip("xdist")
+        result = pytester.runpytest(
+            "-n2", "--dist=each", "--subtests-shard=auto", "-p", "no:randomly"
+        )
+        # Each worker runs the tests, but only its share of their subtests.
+        result.stdout.fnmatch_lines(["* 6 passed, 50 subtests passed in *"])
+
+    def test_auto_without_dist_each(
+        self, sharded_script: None, pytester: pytest.Pytester
+    ) -> None:
+        pytest.importorskip("xdist")
+        result = pytester.runpytest("-n2", "--subtests-shard=auto")
+        assert result.ret == pytest.ExitCode.USAGE_ERROR
+        result.stderr.fnmatch_lines(["*--subtests-shard=auto requires --dist each"])
+
+    def test_auto_without_xdist(
+        self, sharded_script: None, pytester: pytest.Pytester
     ) -> None:
+        result = pytester.runpytest("--subtests-shard=auto")
+        result.stdout.fnmatch_lines(["* 3 passed, 50 subtests passed in *"])
+
+    def test_failures(self, pytester: pytest.Pytester) -> None:
         pytester.makepyfile(
-            rf"""
-            import sys
+            """
+            def test_foo(subtests):
+                for i in range(10):
+                    with subtests.test(i=i) as subtest:
+                        if subtest.skipped:
+                            continue
+                        assert False
+            """
+        )
+        result = pytester.runpytest("--subtests-shard=0/2")
+        failed = result.parseoutcomes()["failed"]
+        result = pytester.runpytest("--subtests-shard=1/2")
+        assert failed + result.parseoutcomes()["failed"] == 10
 
-            def test(subtests, {fixture}):
-                print('start test')
+    def test_skipped_body_raises(self, pytester: pytest.Pytester) -> None:
+        """The body of a subtest of another shard still runs, but only its shard reports it."""
+        pytester.makepyfile(
+            """
+            def test_foo(subtests):
+                for i in range(4):
+                    with subtests.test(i=i):
+                        print(f"body {i}")
+                        assert i % 2 == 0
+            """
+        )
+        failed = []
+        passed = 0
+        for index in range(2):
+            result = pytester.runpytest(f"--subtests-shard={index}/2")
+            failed += [
+                line.strip("_ ")
+                for line in result.outlines
+                if line.startswith("_") and "test_foo (i=" in line
+            ]
+            outcomes = result.parseoutcomes()
+            assert outcomes.get("failed", 0) + outcomes.get("subtests", 0) == 2
+            passed += outcomes.get("subtests", 0)
+        assert sorted(failed) == [
+            "test_foo (i=1)",
+            "test_foo (i=3)",
+        ]
+        assert passed == 2
 
-                with subtests.test(i='A'):
-                    print("hello stdout A")
-                    print("hello stderr A", file=sys.stderr)
+    def test_skipped(self, pytester: pytest.Pytester) -> None:
+        """Each subtest runs in one shard, even if its parameters differ between processes."""
+        pytester.makepyfile(
+            """
+            from pathlib import Path
 
-                out, err = {fixture}.readouterr()
-                assert out == 'start test\nhello stdout A\n'
-                assert err == 'hello stderr A\n'
+            class Foo:
+                pass
+
+            def test_foo(subtests):
+                for i in range(10):
+                    with subtests.test(foo=Foo()) as subtest:
+                        if subtest.skipped:
+                            continue
+                        path = Path(f"ran-{i}")
+                        assert not path.exists()
+                        path.touch()
             """
         )
-        result = pytester.runpytest()
+        outcomes = [
+            pytester.runpytest(f"--subtests-shard={index}/2").parseoutcomes()
+            for index in range(2)
+        ]
+        assert [outcome.get("failed", 0) for outcome in outcomes] == [0, 0]
+        assert sum(outcome["subtests"] for outcome in outcomes) == 10
+        assert sorted(path.name for path in pytester.path.glob("ran-*")) == sorted(
+            f"ran-{i}" for i in range(10)
+        )
+
+    @pytest.mark.parametrize("value", ["2/2", "1", "a/b"])
+    def test_invalid(self, pytester: pytest.Pytester, value: str) -> None:
+        result = pytester.runpytest(f"--subtests-shard={value}")
+        assert result.ret == pytest.ExitCode.USAGE_ERROR
+        result.stderr.fnmatch_lines(["*argument --subtests-shard: *"])
+
+
+class TestLastFailed:
+    @pytest.mark.parametrize("mode", ["normal", "xdist"])
+    def test_lf(
+        self,
+        pytester: pytest.Pytester,
+        monkeypatch: pytest.MonkeyPatch,
+        mode: Literal["normal", "xdist"],
+    ) -> None:
+        args = ["-v"]
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        pytester.makepyfile(
+            """
+            import os
+
+            def test_foo(subtests):
+                for i in range(5):
+                    with subtests.test("lf", i=i):
+                        assert i not in (1, 3) or os.environ.get("FIXED")
+
+            def test_bar(subtests):
+                with subtests.test("bar"):
+                    pass
+            """
+        )
+        result = pytester.runpytest(*args)
+        result.stdout.fnmatch_lines(["* 2 failed, 2 passed, 4 subtests passed in *"])
+
+        result = pytester.runpytest("--subtests-lf", *args)
+        result.stdout.fnmatch_lines(["* 2 failed, 2 passed, 1 subtests passed in *"])
+        result.stdout.no_fnmatch_line("*(i=0)*")
+
+        # Fixed subtests are forgotten...
+        monkeypatch.setenv("FIXED", "1")
+        result = pytester.runpytest("--subtests-lf", *args)
+        result.stdout.fnmatch_lines(["* 2 passed, 3 subtests passed in *"])
+
+        # ...so all the subtests run again once none of them is failing.
+        result = pytester.runpytest("--subtests-lf", *args)
+        result.stdout.fnmatch_lines(["* 2 passed, 6 subtests passed in *"])
+
+    @pytest.mark.parametrize("mode", ["normal", "xdist"])
+    def test_lf_removed(
+        self,
+        pytester: pytest.Pytester,
+        monkeypatch: pytest.MonkeyPatch,
+        mode: Literal["normal", "xdist"],
+    ) -> None:
+        """The subtests of a test all run again once none of those which failed exists anymore."""
+        args = ["-v"]
+        if mode == "xdist":
+            pytest.importorskip("xdist")
+            args.append("-n1")
+        pytester.makepyfile(
+            """
+            import os
+
+            def test_foo(subtests):
+                for i in range(int(os.environ.get("COUNT", 5))):
+                    with subtests.test("lf", i=i):
+                        assert i < 4
+            """
+        )
+        result = pytester.runpytest(*args)
+        result.stdout.fnmatch_lines(["* 1 failed, 1 passed, 4 subtests passed in *"])
+
+        monkeypatch.setenv("COUNT", "4")
+        result = pytester.runpytest("--subtests-lf", *args)
+        # Not run again in the same session.
+        result.stdout.fnmatch_lines(["* 1 passed in *"])
+        assert (
+            pytester.path.joinpath(".pytest_cache/v/subtests/lastfailed").read_text()
+            == "{}"
+        )
+
+        result = pytester.runpytest("--subtests-lf", *args)
+        result.stdout.fnmatch_lines(["* 1 passed, 4 subtests passed in *"])
+
+    @pytest.mark.parametrize("how", ["aggregate", "check_all"])
+    def test_lf_aggregated(
+        self,
+        pytester: pytest.Pytester,
+        monkeypatch: pytest.MonkeyPatch,
+        how: Literal["aggregate", "check_all"],
+    ) -> None:
+        """Subtests fixed while only counted as passing are forgotten too."""
+        pytester.makepyfile(
+            f"""
+            import os
+
+            def test_foo(subtests):
+                fixed = bool(os.environ.get("FIXED"))
+                if {how!r} == "check_all":
+                    subtests.check_all([i < 4 or fixed for i in range(5)], True)
+                    return
+                for i in range(5):
+                    with subtests.test(i=i):
+                        assert i < 4 or fixed
+            """
+        )
+        args = ["--subtests-aggregate"] if how == "aggregate" else []
+        result = pytester.runpytest(*args)
+        result.stdout.fnmatch_lines(["* 1 failed, 1 passed, 4 subtests passed in *"])
+
+        monkeypatch.setenv("FIXED", "1")
+        result = pytester.runpytest("--subtests-lf", *args)
+        result.stdout.fnmatch_lines(["* 1 passed, * subtests passed in *"])
+        assert (
+            pytester.path.joinpath(".pytest_cache/v/subtests/lastfailed").read_text()
+            == "{}"
+        )
+
+    def test_lf_regression(
+        self, pytester: pytest.Pytester, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        """The bodies of the subtests skipped by --subtests-lf are reported if they raise."""
+        pytester.makepyfile(
+            """
+            import os
+
+            def test_foo(subtests):
+                for i in range(3):
+                    with subtests.test("lf", i=i):
+                        assert i != int(os.environ.get("FAILING", 1))
+            """
+        )
+        result = pytester.runpytest("-v")
+        result.stdout.fnmatch_lines(["* 1 failed, 1 passed, 2 subtests passed in *"])
+
+        monkeypatch.setenv("FAILING", "2")
+        result = pytester.runpytest("-v", "--subtests-lf")
         result.stdout.fnmatch_lines(
             [
-                "*1 passed*",
+                "*::test_foo [[]lf[]] (i=1) SUBPASS*",
+                "*::test_foo [[]lf[]] (i=2) SUBFAIL*",
+                "* 1 failed, 1 passed, 1 subtests passed in *",
             ]
         )
+        result.stdout.no_fnmatch_line("*(i=0)*")
+
+    def test_ff(self, pytester: pytest.Pytester) -> None:
+        pytester.makepyfile(
+            """
+            import os
+
+            def test_foo(subtests):
+                def check(i):
+                    assert i < 3 or os.environ.get("FIXED")
+                    return i
+
+                results = subtests.map(check, range(5), msg="ff", max_workers=1)
+                # The results are still in the order of the items, with None for skipped items.
+                assert results in ([0, 1, 2, None, None], [None] * 5)
+            """
+        )
+        result = pytester.runpytest("-v")
+        result.stdout.fnmatch_lines(["* 2 failed, 1 passed, 3 subtests passed in *"])
+
+        result = pytester.runpytest("-v", "--subtests-ff")
+        result.stdout.fnmatch_lines(
+            [
+                "*::test_foo [[]ff[]] (item=3) SUBFAIL*",
+                "*::test_foo [[]ff[]] (item=4) SUBFAIL*",
+                "*::test_foo [[]ff[]] (item=0) SUBPASS*",
+                "*::test_foo [[]ff[]] (item=1) SUBPASS*",
+                "*::test_foo [[]ff[]] (item=2) SUBPASS*",
+            ],
+            consecutive=True,
+        )
+
+        result = pytester.runpytest("-v", "--subtests-lf")
+        result.stdout.fnmatch_lines(["* 2 failed, 1 passed in *"])
+        result.stdout.no_fnmatch_line("*(item=0)*")
 
 
 class TestLogging:
@@ -692,6 +2271,55 @@ class TestLogging:
             ]
         )
 
+    def test_log_slices(self, pytester: pytest.Pytester) -> None:
+        """Each subtest only gets the records logged while it executes, and no empty log sections."""
+        pytester.makepyfile(
+            """
+            import logging
+
+            def test_foo(subtests):
+                with subtests.test("sub1"):
+                    logging.info("sub1 logging")
+                    assert False
+
+                logging.info("between subtests")
+
+                with subtests.test("sub2"):
+                    assert False
+
+                with subtests.test("sub3"):
+                    with subtests.test("sub3-inner"):
+                        logging.info("sub3-inner logging")
+                    logging.info("sub3 logging")
+                    assert False
+            """
+        )
+        result = pytester.runpytest("--log-level=INFO")
+        result.stdout.fnmatch_lines(
+            [
+                "*___ test_foo [[]sub1[]] __*",
+                "*-- Captured log call ---*",
+                "INFO     root:test_log_slices.py:5 sub1 logging",
+                "*___ test_foo [[]sub2[]] __*",
+                "test_log_slices.py:11: AssertionError",
+                "*___ test_foo [[]sub3[]] __*",
+                "test_log_slices.py:17: AssertionError",
+                "*-- Captured log call ---*",
+                "INFO     root:test_log_slices.py:15 sub3-inner logging",
+                "INFO     root:test_log_slices.py:16 sub3 logging",
+                "*== short test summary info ==*",
+            ],
+            consecutive=False,
+        )
+        result.stdout.fnmatch_lines(
+            [
+                "test_log_slices.py:11: AssertionError",
+                "*___ test_foo [[]sub3[]] __*",
+            ],
+            consecutive=True,
+        )
+        result.stdout.no_fnmatch_line("INFO *between subtests")
+
     def test_caplog(self, pytester: pytest.Pytester) -> None:
         pytester.makepyfile(
             """
@@ -834,3 +2462,155 @@ def test_exitfirst(pytester: pytest.Pytester) -> None:
         consecutive=True,
     )
     result.stdout.no_fnmatch_line("*sub2*")  # sub2 not executed.
+
+
+def test_gather_exitfirst(pytester: pytest.Pytester) -> None:
+    """
+    Validate that when passing --exitfirst, subtests.gather() cancels the pending awaitables after
+    the first failed subtest.
+    """
+    pytester.makepyfile(
+        """
+        import asyncio
+
+        async def check(i):
+            if i > 0:
+                await asyncio.sleep(10)
+            assert False
+
+        async def gather(subtests):
+            await subtests.gather(*(check(i) for i in range(3)), msg="gather")
+
+        def test_foo(subtests):
+            asyncio.run(gather(subtests))
+        """
+    )
+    result = pytester.runpytest("-v", "-x")
+    result.stdout.fnmatch_lines(
+        [
+            "test_gather_exitfirst.py::test_foo [[]gather[]] (index=0) SUBFAIL *",
+            "test_gather_exitfirst.py::test_foo FAILED *",
+            "* stopping after 2 failures *",
+        ]
+    )
+    result.stdout.no_fnmatch_line("*(index=1)*")
+    assert result.duration < 10
+
+
+def test_lazy_imports(pytester: pytest.Pytester) -> None:
+    """The modules only needed by some features are not imported along with the plugin."""
+    modules = [
+        "asyncio",
+        "cProfile",
+        "concurrent.futures.process",
+        "multiprocessing",
+        "pstats",
+    ]
+    result = pytester.runpython_c(
+        f"import sys, pytest_subtests.plugin; print(sorted(set({modules!r}) & set(sys.modules)))"
+    )
+    assert result.outlines == ["[]"]
+
+
+class TestSubTestReport:
+    @pytest.mark.parametrize(
+        "body",
+        ["pass", "assert 1 == 2", "pytest.skip('skip me')", "pytest.xfail('xfail me')"],
+    )
+    def test_from_test_report(self, pytester: pytest.Pytester, body: str) -> None:
+        """The direct construction path produces the same report as the JSON round-trip."""
+        from _pytest.reports import TestReport
+
+        from pytest_subtests.plugin import SubTestContext
+        from pytest_subtests.plugin import SubTestReport
+
+        pytester.makepyfile(
+            f"""
+            import pytest
+
+            def test_foo():
+                print("some output")
+                {body}
+            """
+        )
+        reprec = pytester.inline_run()
+        (test_report,) = [
+            x for x in reprec.getreports("pytest_runtest_logreport") if x.when == "call"
+        ]
+        context = SubTestContext("custom", {"i": 1})
+
+        direct = SubTestReport._from_test_report(test_report)
+        direct.context = context
+        via_json = TestReport._from_json.__func__(  # type: ignore[attr-defined]
+            SubTestReport, test_report._to_json()
+        )
+        via_json.context = context
+
+        assert type(direct) is type(via_json) is SubTestReport
+        assert direct._to_json() == via_json._to_json()
+        assert direct.longreprtext == via_json.longreprtext
+        assert direct.sub_test_description() == via_json.sub_test_description()
+
+        # The new report must not share mutable state with the original one.
+        direct.sections.append(("Captured log call", "some log"))
+        assert direct.sections != test_report.sections
+
+    def test_batch(self, pytester: pytest.Pytester) -> None:
+        """A batch of reports is rebuilt from the report carrying it."""
+        from pytest_subtests.plugin import SubTestReport
+
+        pytester.makepyfile(
+            """
+            import pytest
+
+            def test_foo(subtests):
+                for i in range(3):
+                    with subtests.test("custom", i=i):
+                        print(f"output {i}")
+                        if i == 1:
+                            pytest.skip("skip me")
+            """
+        )
+        reprec = pytester.inline_run()
+        reports = [
+            x
+            for x in reprec.getreports("pytest_runtest_logreport")
+            if isinstance(x, SubTestReport)
+        ]
+        *batch, carrier = reports
+        carrier._subtests_batch = batch  # type: ignore[attr-defined]
+
+        data = carrier._to_json()
+        # Only the differences with the carrier are sent for the batched reports.
+        assert set(data["_subtest.batch"][0]) == {
+            "_subtest.context",
+            "duration",
+            "sections",
+            "start",
+            "stop",
+        }
+        rebuilt = SubTestReport._from_json(data)
+
+        assert rebuilt._to_json() == carrier._to_json()
+        assert [r._to_json() for r in rebuilt._subtests_batch] == [
+            r._to_json() for r in batch
+        ]
+        assert rebuilt._subtests_batch[1].longrepr == batch[1].longrepr
+
+    def test_context_serialization(self) -> None:
+        """The description is computed once, and not serialized with the context."""
+        from pytest_subtests.plugin import SubTestContext
+
+        context = SubTestContext("custom", {"b": [1], "a": "x"})
+        with pytest.raises(AttributeError):
+            context.msg = "other"  # type: ignore[misc]
+        # Not hashable, like its kwargs.
+        with pytest.raises(TypeError):
+            hash(context)
+
+        assert context.description() == "[custom] (a='x', b=[1])"
+        data = context._to_json()
+        assert data == {"msg": "custom", "kwargs": {"b": [1], "a": "x"}}
+        rebuilt = SubTestContext(**data)
+        assert rebuilt == context
+        assert rebuilt.description() == context.description()